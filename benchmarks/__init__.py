@@ -0,0 +1,10 @@
+"""
+Benchmarks of WikiExtractor: a synthetic dump generator, microbenchmarks of
+the cleaning functions and end-to-end extraction runs, whose results are
+saved as JSON and compared against a baseline.
+
+    python -m benchmarks generate dump.xml.bz2 --pages 20000
+    python -m benchmarks run --output baseline.json
+    python -m benchmarks run --output current.json
+    python -m benchmarks compare baseline.json current.json
+"""
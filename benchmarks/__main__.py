@@ -0,0 +1,108 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+
+from benchmarks import end_to_end, micro
+from benchmarks.generate import generate
+
+
+def save(results: dict, filename: str) -> None:
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def compare(baseline: str, current: str, threshold: float) -> int:
+    """
+    Print the change in time of the benchmarks in both files.
+    :return: the number of regressions, slower by more than :param threshold:.
+    """
+    with open(baseline) as f:
+        before = json.load(f)['results']
+    with open(current) as f:
+        after = json.load(f)['results']
+    regressions = 0
+    print('%-50s %10s %10s %8s' % ('benchmark', 'baseline', 'current', 'change'))
+    for name in sorted(set(before) & set(after)):
+        old = before[name]['seconds']
+        new = after[name]['seconds']
+        change = new / old - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print('%-50s %9.3fs %9.3fs %+7.1f%%%s' % (name, old, new, 100 * change, flag))
+    for name in sorted(set(before) ^ set(after)):
+        print('%-50s only in %s' % (name, baseline if name in before else current))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='WikiExtractor benchmarks')
+    commands = parser.add_subparsers(dest='command')
+
+    parser_generate = commands.add_parser('generate', help='write a synthetic dump')
+    parser_generate.add_argument('dump', help='dump file (.xml, .xml.bz2 or .xml.gz)')
+    parser_generate.add_argument('--pages', type=int, default=10000,
+                                 help='number of pages (default %(default)s)')
+    parser_generate.add_argument('--seed', type=int, default=0)
+
+    parser_run = commands.add_parser('run', help='run benchmarks and save their results')
+    parser_run.add_argument('--output', required=True, help='JSON file of the results')
+    parser_run.add_argument('--micro_pages', type=int, default=500,
+                            help='articles of the microbenchmarks, 0 to skip them (default %(default)s)')
+    parser_run.add_argument('--repeat', type=int, default=3,
+                            help='runs of each microbenchmark, the best is kept (default %(default)s)')
+    parser_run.add_argument('--dump', default=None,
+                            help='dump of the end-to-end runs (default: generated)')
+    parser_run.add_argument('--dump_pages', type=int, default=5000,
+                            help='pages of the generated dump, 0 to skip end-to-end runs '
+                            '(default %(default)s)')
+    parser_run.add_argument('--processes', default='1,2,4',
+                            help='process counts of the end-to-end runs (default %(default)s)')
+    parser_run.add_argument('--seed', type=int, default=0)
+
+    parser_compare = commands.add_parser('compare', help='compare results with a baseline')
+    parser_compare.add_argument('baseline', help='JSON file of the baseline results')
+    parser_compare.add_argument('current', help='JSON file of the current results')
+    parser_compare.add_argument('--threshold', type=float, default=0.1,
+                                help='slowdown reported as a regression (default %(default)s)')
+
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        generate(args.dump, args.pages, args.seed)
+    elif args.command == 'run':
+        results = {}
+        if args.micro_pages:
+            results.update(micro.run(args.micro_pages, args.seed, args.repeat))
+        processes = [int(count) for count in args.processes.split(',')]
+        if args.dump:
+            results.update(end_to_end.run(args.dump, processes))
+        elif args.dump_pages:
+            with tempfile.TemporaryDirectory() as tmp:
+                dump = os.path.join(tmp, 'synthetic.xml.bz2')
+                generate(dump, args.dump_pages, args.seed)
+                results.update(end_to_end.run(dump, processes))
+        for name, result in sorted(results.items()):
+            print('%-50s %9.3fs' % (name, result['seconds']))
+        save(results, args.output)
+    elif args.command == 'compare':
+        sys.exit(1 if compare(args.baseline, args.current, args.threshold) else 0)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
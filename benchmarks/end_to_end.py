@@ -0,0 +1,45 @@
+"""
+End-to-end extraction runs of a dump, across process counts.
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Last log line of an extraction
+FINISHED = re.compile(r'Finished (\d+)-process extraction of (\d+) (\w+)')
+
+
+def run_dump(dump: str, processes: int, options: list = ()) -> dict:
+    """
+    Extract :param dump: with :param processes: extract processes, in a new
+    process.
+    :return: {'seconds', 'articles', 'articles_per_s', 'mb_per_s'}.
+    """
+    output = tempfile.mkdtemp()
+    os.rmdir(output)  # created by the extractor
+    try:
+        command = [sys.executable, '-m', 'wikiextractor.main', dump, '-o', output,
+                   '--processes', str(processes)] + list(options)
+        start = time.perf_counter()
+        log = subprocess.run(command, check=True, stderr=subprocess.PIPE, universal_newlines=True).stderr
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(output, ignore_errors=True)
+    match = FINISHED.search(log)
+    articles = int(match.group(2)) if match and match.group(3) == 'articles' else 0
+    return {'seconds': seconds, 'articles': articles, 'articles_per_s': articles / seconds,
+            'mb_per_s': os.path.getsize(dump) / 1e6 / seconds}
+
+
+def run(dump: str, processes: list, options: list = ()) -> dict:
+    """
+    :return: dict from benchmark name to the result of run_dump().
+    """
+    name = os.path.basename(dump)
+    return {'e2e.%s.processes_%d' % (name, count): run_dump(dump, count, options)
+            for count in processes}
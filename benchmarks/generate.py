@@ -0,0 +1,228 @@
+"""
+Deterministic generator of synthetic MediaWiki XML dumps, with templates,
+tables, links, references and giant list pages.
+"""
+
+import bz2
+import gzip
+import os
+import random
+from xml.sax.saxutils import escape
+
+HEADER = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10" xml:lang="en">
+  <siteinfo>
+    <sitename>Wikipedia</sitename>
+    <dbname>enwiki</dbname>
+    <base>https://en.wikipedia.org/wiki/Main_Page</base>
+    <generator>MediaWiki 1.36.0-wmf.1</generator>
+    <case>first-letter</case>
+    <namespaces>
+      <namespace key="0" case="first-letter" />
+      <namespace key="6" case="first-letter">File</namespace>
+      <namespace key="10" case="first-letter">Template</namespace>
+      <namespace key="14" case="first-letter">Category</namespace>
+      <namespace key="828" case="first-letter">Module</namespace>
+    </namespaces>
+  </siteinfo>
+"""
+
+FOOTER = "</mediawiki>\n"
+
+PAGE = """  <page>
+    <title>%s</title>
+    <ns>%d</ns>
+    <id>%d</id>%s
+    <revision>
+      <id>%d</id>
+      <timestamp>2021-01-01T00:00:00Z</timestamp>
+      <contributor>
+        <username>Editor</username>
+        <id>42</id>
+      </contributor>
+      <model>wikitext</model>
+      <format>text/x-wiki</format>
+      <text bytes="%d" xml:space="preserve">%s</text>
+      <sha1>%040x</sha1>
+    </revision>
+  </page>
+"""
+
+WORDS = ("the of and in to a was is for on as by with he that at from his it an were are which this "
+         "also be has or had first one their its new after but who not they have her she two been "
+         "other when there all during into school time may years more most only over city some world "
+         "would where later up such used many can state about national out known university united "
+         "then made through since american history river album film music war king team season "
+         "county village population district church railway station league party election").split()
+
+NAMES = ("Alexander Berlin Carolina Danube Edinburgh Florence Geneva Hamburg Istanbul Jakarta Kyoto "
+         "Lisbon Madrid Nairobi Oslo Prague Quebec Rome Stockholm Toronto Utrecht Vienna Warsaw "
+         "Yokohama Zurich Amazon Baltic Caspian Everest Sahara").split()
+
+# Ratio of giant list pages
+GIANT_PAGES = 0.002
+
+
+class Generator(object):
+    """
+    Generator of the wikitext of pages, from a seeded random generator.
+    """
+
+    def __init__(self, seed: int = 0) -> None:
+        self.r = random.Random(seed)
+
+    def words(self, n: int) -> str:
+        return ' '.join(self.r.choice(WORDS) for _ in range(n))
+
+    def name(self) -> str:
+        return '%s %s' % (self.r.choice(NAMES), self.r.choice(WORDS).title())
+
+    def link(self) -> str:
+        k = self.r.random()
+        if k < 0.5:
+            return '[[%s]]' % self.name()
+        if k < 0.8:
+            return '[[%s|%s]]' % (self.name(), self.words(2))
+        if k < 0.9:
+            return '[[%s]]s' % self.name()
+        return '[[Category:%s]]' % self.name()
+
+    def template(self, depth: int = 0) -> str:
+        params = []
+        for i in range(self.r.randint(1, 6)):
+            value = self.words(self.r.randint(1, 4))
+            if depth < 2 and self.r.random() < 0.2:
+                value += ' ' + self.template(depth + 1)
+            if self.r.random() < 0.2:
+                value += ' ' + self.link()
+            params.append('%s=%s' % (self.r.choice(WORDS), value))
+        return '{{%s|%s}}' % (self.r.choice(['cite web', 'cite book', 'convert', 'lang', 'nowrap',
+                                             'Infobox settlement', 'main', 'citation needed']),
+                              '|'.join(params))
+
+    def table(self) -> str:
+        rows = ['{| class="wikitable"', '|+ ' + self.words(3)]
+        rows.append('! ' + ' !! '.join(self.words(1) for _ in range(3)))
+        for _ in range(self.r.randint(2, 10)):
+            rows.append('|-')
+            rows.append('| ' + ' || '.join(self.words(2) if self.r.random() < 0.7 else self.link()
+                                           for _ in range(3)))
+        rows.append('|}')
+        return '\n'.join(rows)
+
+    def ref(self) -> str:
+        k = self.r.random()
+        if k < 0.3:
+            return '<ref name="r%d" />' % self.r.randint(1, 20)
+        if k < 0.7:
+            return '<ref>%s</ref>' % self.template()
+        return '<ref name="r%d">%s [http://example.org/%s %s]</ref>' % (
+            self.r.randint(1, 20), self.words(4), self.r.choice(WORDS), self.words(2))
+
+    def sentence(self) -> str:
+        parts = []
+        for _ in range(self.r.randint(4, 14)):
+            k = self.r.random()
+            if k < 0.15:
+                parts.append(self.link())
+            elif k < 0.2:
+                parts.append("'''%s'''" % self.words(2))
+            elif k < 0.25:
+                parts.append("''%s''" % self.words(2))
+            elif k < 0.28:
+                parts.append(self.template())
+            elif k < 0.31:
+                parts.append(self.ref())
+            elif k < 0.32:
+                parts.append('<math>x^%d + y</math>' % self.r.randint(2, 9))
+            elif k < 0.33:
+                parts.append('<!-- %s -->' % self.words(3))
+            elif k < 0.34:
+                parts.append('[https://example.com/%s %s]' % (self.r.choice(WORDS), self.words(2)))
+            elif k < 0.35:
+                parts.append('&nbsp;%d&ndash;%d' % (self.r.randint(1900, 1950),
+                                                    self.r.randint(1951, 2020)))
+            else:
+                parts.append(self.words(self.r.randint(1, 5)))
+        return ' '.join(parts).capitalize() + '.'
+
+    def paragraph(self) -> str:
+        return ' '.join(self.sentence() for _ in range(self.r.randint(2, 7)))
+
+    def article(self, title: str) -> str:
+        blocks = []
+        if self.r.random() < 0.5:
+            blocks.append(self.template())
+        blocks.append("'''%s''' %s" % (title, self.paragraph()))
+        for _ in range(self.r.randint(0, 6)):
+            blocks.append('== %s ==' % self.words(2).title())
+            for _ in range(self.r.randint(1, 3)):
+                k = self.r.random()
+                if k < 0.15:
+                    blocks.append(self.table())
+                elif k < 0.3:
+                    blocks.append('\n'.join('* ' + self.sentence() for _ in range(self.r.randint(2, 8))))
+                elif k < 0.35:
+                    blocks.append('[[File:%s.jpg|thumb|%s %s]]' % (self.name(), self.words(3),
+                                                                   self.link()))
+                else:
+                    blocks.append(self.paragraph())
+        blocks.append('== References ==\n{{reflist}}')
+        blocks.append('\n'.join(self.link() for _ in range(self.r.randint(0, 3))))
+        return '\n\n'.join(blocks)
+
+    def list_page(self, items: int) -> str:
+        """
+        A giant list page, e.g. List of ...
+        """
+        lines = ["This is a '''list''' of %s." % self.words(3)]
+        for i in range(items):
+            if i % 200 == 0:
+                lines.append('\n== %s ==' % self.words(2).title())
+            lines.append('* %s (%d) &ndash; %s%s' % (self.link(), self.r.randint(1800, 2020),
+                                                     self.words(self.r.randint(2, 8)),
+                                                     self.ref() if self.r.random() < 0.1 else ''))
+        return '\n'.join(lines)
+
+
+def pages(count: int, seed: int = 0):
+    """
+    :return: an iterator over the XML of :param count: pages, as in a dump.
+    """
+    generator = Generator(seed)
+    r = generator.r
+    for id in range(1, count + 1):
+        k = r.random()
+        ns = 0
+        redirect = ''
+        if k < GIANT_PAGES:
+            title = 'List of %s' % generator.words(2)
+            text = generator.list_page(r.randint(5000, 20000))
+        elif k < 0.05:
+            title = generator.name()
+            redirect = '\n    <redirect title="%s" />' % generator.name()
+            text = '#REDIRECT [[%s]]' % generator.name()
+        elif k < 0.08:
+            title = 'Template:%s' % generator.name()
+            ns = 10
+            text = '<includeonly>%s</includeonly><noinclude>%s</noinclude>' % (
+                generator.template(), generator.words(5))
+        else:
+            title = '%s %d' % (generator.name(), id)
+            text = generator.article(title)
+        text = escape(text, {'"': '&quot;'})
+        yield PAGE % (escape(title), ns, id, redirect, 10 * id, len(text), text,
+                      r.getrandbits(160))
+
+
+def generate(filename: str, count: int, seed: int = 0) -> None:
+    """
+    Write a dump of :param count: pages to :param filename:, compressed
+    according to its extension (.bz2, .gz).
+    """
+    openers = {'.bz2': bz2.open, '.gz': gzip.open}
+    opener = openers.get(os.path.splitext(filename)[1], open)
+    with opener(filename, 'wt', encoding='utf-8') as f:
+        f.write(HEADER)
+        for page in pages(count, seed):
+            f.write(page)
+        f.write(FOOTER)
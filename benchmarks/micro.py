@@ -0,0 +1,70 @@
+"""
+Microbenchmarks of the cleaning functions, on the wikitext of generated pages.
+"""
+
+import argparse
+import html
+import time
+
+from wikiextractor.clean import (Extractor, clean, compact, dropNested,
+                                 findBalanced, replaceInternalLinks, unescape)
+
+from benchmarks.generate import Generator
+
+
+def corpus(count: int, seed: int = 0, giant: int = 2) -> list:
+    """
+    The wikitext of :param count: generated articles and of :param giant:
+    giant list pages, XML escaped as the extract processes get it.
+    """
+    generator = Generator(seed)
+    texts = [generator.article(generator.name()) for _ in range(count)]
+    texts.extend(generator.list_page(10000) for _ in range(giant))
+    return [html.escape(text, quote=False) for text in texts]
+
+
+def make_args():
+    return argparse.Namespace(acceptedNamespaces=['w', 'wiktionary', 'wikt'], escape_doc=False,
+                              keep_doc_tag=False)
+
+
+def benchmarks(texts: list) -> dict:
+    """
+    :return: the functions to measure, from name to a function applied to
+    each text.
+    """
+    extractor = Extractor(make_args())
+    accepted = extractor.args.acceptedNamespaces
+    cleaned = [clean(extractor, text) for text in texts]
+    unescaped = [html.unescape(text) for text in texts]
+    # links left unclosed, e.g. in truncated or vandalized pages
+    unclosed = ['[[Link ' * 20000, '[[Link]] ' * 100 + '[[Link ' * 20000]
+    return {
+        'clean': (texts, lambda text: clean(extractor, text)),
+        'compact': (cleaned, compact),
+        'dropNested': (texts, lambda text: dropNested(text, r'{{', r'}}')),
+        'findBalanced': (unescaped, lambda text: list(findBalanced(text, ['[['], [']]']))),
+        'findBalanced_unclosed': (unclosed, lambda text: list(findBalanced(text, ['[['], [']]']))),
+        'replaceInternalLinks': (unescaped, lambda text: replaceInternalLinks(text, accepted)),
+        'unescape': (texts, unescape),
+    }
+
+
+def run(count: int = 500, seed: int = 0, repeat: int = 3) -> dict:
+    """
+    Time each function over the corpus, taking the best of :param repeat: runs.
+    :return: dict from benchmark name to {'seconds', 'mb_per_s'}.
+    """
+    texts = corpus(count, seed)
+    results = {}
+    for name, (inputs, function) in benchmarks(texts).items():
+        size = sum(len(text) for text in inputs) / 1e6
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for text in inputs:
+                function(text)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results['micro.' + name] = {'seconds': best, 'mb_per_s': size / best}
+    return results
@@ -0,0 +1,171 @@
+import logging
+import threading
+from multiprocessing import Queue, Semaphore, Value
+from timeit import default_timer
+
+# Seconds between samples of the jobs queue
+SAMPLE_INTERVAL = 0.5
+
+# Samples between adjustments
+SAMPLES = 10
+
+
+class AdjustableQueue(object):
+    """
+    Jobs queue whose bound can change while it is used: put() takes a permit
+    of a semaphore, given back by get(), and the bound is lowered or raised
+    by holding or returning permits.
+    None (the poison pill of the extract processes) is not bounded.
+    """
+
+    def __init__(self, limit: int, max_limit: int) -> None:
+        """
+        :param limit: initial number of jobs queued at most.
+        :param max_limit: max value of the bound.
+        """
+        self.queue = Queue()
+        self.permits = Semaphore(max_limit)
+        self.depth = Value('i', 0)  # jobs queued
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.held = 0  # permits held to lower the bound, by the process that created the queue
+        self.set_limit(limit)
+
+    def put(self, job) -> None:
+        if job is not None:
+            self.permits.acquire()
+            with self.depth.get_lock():
+                self.depth.value += 1
+        self.queue.put(job)
+
+    def get(self):
+        job = self.queue.get()
+        if job is not None:
+            with self.depth.get_lock():
+                self.depth.value -= 1
+            self.permits.release()
+        return job
+
+    def qsize(self) -> int:
+        return self.depth.value
+
+    def set_limit(self, limit: int) -> None:
+        """
+        Change the bound to :param limit: jobs. When it is lowered, permits
+        are taken as jobs are got, so the bound may be reached only later.
+        """
+        self.limit = max(1, min(limit, self.max_limit))
+        self.collect()
+
+    def collect(self) -> None:
+        """
+        Take or return the permits needed to match the bound, without waiting.
+        """
+        target = self.max_limit - self.limit
+        while self.held > target:
+            self.permits.release()
+            self.held -= 1
+        while self.held < target and self.permits.acquire(False):
+            self.held += 1
+
+
+class Autotuner(object):
+    """
+    Adjust the number of extract processes and the bound of the jobs queue
+    during an extraction, from the occupancy of the queue and the busy time
+    of the extract processes, measured by a thread of the main process.
+    - Workers idle while the queue is empty: the mapper cannot feed them,
+      one is stopped, through a poison pill.
+    - Workers busy while the queue is full: one is started, up to the max.
+    - The bound grows when the queue runs empty while workers are busy, and
+      shrinks towards twice the workers when it stays full, so that batches
+      do not wait in memory.
+    """
+
+    def __init__(self, jobs_queue: AdjustableQueue, metrics, start_worker, max_workers: int,
+                 workers: int) -> None:
+        """
+        :param metrics: Metrics with the busy time of each worker.
+        :param start_worker: function(index) starting an extract process
+            whose number is index, and returning it.
+        :param max_workers: max number of extract processes.
+        :param workers: number of extract processes to start with.
+        """
+        self.jobs_queue = jobs_queue
+        self.metrics = metrics
+        self.start_worker = start_worker
+        self.max_workers = max_workers
+        self.slots = [start_worker(i) for i in range(workers)]  # last process of each index
+        self.started = list(self.slots)  # all processes started
+        self.active = workers  # processes not sent a poison pill
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        busy = sum(self.metrics.busy[:])
+        last = default_timer()
+        empty = full = 0
+        samples = 0
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            self.jobs_queue.collect()
+            depth = self.jobs_queue.qsize()
+            empty += depth == 0
+            full += depth >= self.jobs_queue.limit
+            samples += 1
+            if samples < SAMPLES:
+                continue
+            now_busy = sum(self.metrics.busy[:])
+            now = default_timer()
+            utilization = (now_busy - busy) / ((now - last) * self.active)
+            self.adjust(utilization, empty / samples, full / samples)
+            busy = now_busy
+            last = now
+            empty = full = samples = 0
+
+    def adjust(self, utilization: float, empty: float, full: float) -> None:
+        """
+        :param utilization: fraction of the time the workers were busy.
+        :param empty: fraction of the samples with the jobs queue empty.
+        :param full: fraction of the samples with the jobs queue full.
+        """
+        queue = self.jobs_queue
+        if utilization < 0.6 and empty > 0.5 and self.active > 1:
+            queue.put(None)  # any idle worker exits
+            self.active -= 1
+            logging.debug("Autotune: %.0f%% busy, queue empty: %d extract processes",
+                          100 * utilization, self.active)
+        elif utilization > 0.9 and full > 0.5 and self.active < self.max_workers:
+            index = self.free_slot()
+            if index is not None:
+                self.slots[index] = self.start_worker(index)
+                self.started.append(self.slots[index])
+                self.active += 1
+                logging.debug("Autotune: %.0f%% busy, queue full: %d extract processes",
+                              100 * utilization, self.active)
+        if empty > 0 and utilization > 0.9:
+            queue.set_limit(queue.limit * 2)
+        elif full > 0.5:
+            queue.set_limit(max(2 * self.active, queue.limit // 2))
+
+    def free_slot(self) -> int:
+        """
+        :return: an index of worker not in use, or None while the stopped
+        workers have not exited yet.
+        """
+        if len(self.slots) < self.max_workers:
+            self.slots.append(None)
+            return len(self.slots) - 1
+        for index, process in enumerate(self.slots):
+            if not process.is_alive():
+                return index
+        return None
+
+    def stop(self) -> None:
+        """
+        Stop adjusting, and log the settled parameters.
+        """
+        self.stopped.set()
+        self.thread.join()
+        logging.info("Autotune settled on --processes %d --queue_size %d",
+                     self.active, self.jobs_queue.limit)
@@ -0,0 +1,111 @@
+import hashlib
+import sqlite3
+import time
+
+from wikiextractor import __version__
+
+# Fraction of the max size to which the cache is reduced when it exceeds it
+EVICT_TO = 0.9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS texts (key BLOB PRIMARY KEY, text TEXT, size INTEGER, used REAL);
+CREATE INDEX IF NOT EXISTS texts_used ON texts (used);
+CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER);
+INSERT OR IGNORE INTO meta VALUES (0, 0);
+"""
+
+
+def create_cache(filename):
+    """
+    Create the cache database, if it does not exist, before extract
+    processes open it.
+    """
+    db = sqlite3.connect(filename)
+    db.execute('PRAGMA journal_mode=WAL')  # readers do not block the writer
+    db.executescript(SCHEMA)
+    db.commit()
+    db.close()
+
+
+class TextCache(object):
+    """
+    Persistent cache of cleaned article text, in a SQLite database shared by
+    the extract processes, each with its own connection.
+    Texts are keyed by a hash of the wikitext and of the arguments affecting
+    its cleaning, and evicted least recently used first when the total size
+    of the texts exceeds max_size.
+    Lookups are immediate, while additions and uses are written by commit(),
+    once per batch of pages.
+    """
+
+    def __init__(self, filename: str, max_size: int, args) -> None:
+        self.db = sqlite3.connect(filename, timeout=60)
+        self.db.execute('PRAGMA synchronous=NORMAL')  # a cache can lose its last commits
+        self.max_size = max_size
+        self.settings = '%s|%s|%s|%s\0' % (__version__, ','.join(sorted(args.acceptedNamespaces)),
+                                           args.escape_doc, args.keep_doc_tag)
+        self.added = []  # (key, text, size, used)
+        self.used = []  # keys of texts found
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> bytes:
+        return hashlib.blake2b((self.settings + text).encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key: bytes) -> str:
+        """
+        :return: the cached text for key, or None.
+        """
+        row = self.db.execute('SELECT text FROM texts WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used.append(key)
+        return row[0]
+
+    def put(self, key: bytes, text: str) -> None:
+        self.added.append((key, text, len(text.encode('utf-8')), time.time()))
+
+    def commit(self) -> None:
+        if not self.added and not self.used:
+            return
+        now = time.time()
+        with self.db:  # one transaction
+            if self.used:
+                self.db.executemany('UPDATE texts SET used = ? WHERE key = ?',
+                                    [(now, key) for key in self.used])
+            added = 0  # size of the texts inserted
+            for row in self.added:
+                # another process may have added the same text meanwhile
+                if self.db.execute('INSERT OR IGNORE INTO texts VALUES (?, ?, ?, ?)', row).rowcount:
+                    added += row[2]
+            if added:
+                self.db.execute('UPDATE meta SET total = total + ?', (added,))
+            total = self.db.execute('SELECT total FROM meta').fetchone()[0]
+            if total > self.max_size:
+                self.evict(total)
+        self.added = []
+        self.used = []
+
+    def evict(self, total: int) -> None:
+        """
+        Delete the least recently used texts, down to a fraction of max_size.
+        """
+        target = int(self.max_size * EVICT_TO)
+        freed = 0
+        keys = []
+        for key, size in self.db.execute('SELECT key, size FROM texts ORDER BY used'):
+            if total - freed <= target:
+                break
+            keys.append((key,))
+            freed += size
+        self.db.executemany('DELETE FROM texts WHERE key = ?', keys)
+        self.db.execute('UPDATE meta SET total = total - ?', (freed,))
+
+    def stats(self) -> tuple:
+        return self.hits, self.misses
+
+    def close(self) -> None:
+        self.commit()
+        self.db.close()
@@ -1,14 +1,20 @@
+import heapq
 import html
 import logging
 import re
 import time
 from html.entities import name2codepoint
-
-from wikiextractor.regex import (ExtLinkBracketedRegex, MagicWords, bold,
-                                 bold_italic, comment, discardElements, dots,
-                                 ignored_tag_patterns, italic, italic_quote,
-                                 listClose, magic_words_regex,
-                                 placeholder_tag_patterns, quote_quote,
+from io import StringIO
+
+from wikiextractor.regex import (ExtLinkBracketedRegex, MagicWords, comment,
+                                 discard_regex, discard_tag_patterns, dots,
+                                 fallback_external_link, fallback_internal_link,
+                                 fallback_tag,
+                                 ignored_tag_patterns, listClose,
+                                 magic_words_regex, markup_regex,
+                                 nested_block_delimiters,
+                                 placeholder_open_patterns,
+                                 placeholder_tag_patterns, quote_delimiters,
                                  section, selfClosing_tag_patterns, spaces,
                                  syntax_highlight_regex, tail_regex)
 
@@ -17,75 +23,75 @@ def clean(extractor, text):
     """
     Transforms wiki markup. If the command line flag --escape_doc is set then the text is also escaped
     @see https://www.mediawiki.org/wiki/Help:Formatting
+    When extractor.stage_stats is set, the time of each stage is recorded in it.
     """
+    stats = extractor.stage_stats
+    for name, stage in clean_stages:
+        if stats is None:
+            text = stage(extractor, text)
+        else:
+            text = stats.run(name, stage, extractor, text)
+    return text
 
-    # Drop transclusions (template, parser functions)
-    text = dropNested(text, r'{{', r'}}')
 
-    # Drop tables
-    text = dropNested(text, r'{\|', r'\|}')
+def cleanNested(extractor, text):
+    # Drop transclusions (template, parser functions) and tables
+    return dropNestedBlocks(text, nested_block_delimiters)
 
-    # replace external links
-    text = replaceExternalLinks(text)
 
-    # replace internal links
-    text = replaceInternalLinks(text, extractor.args.acceptedNamespaces)
+def cleanExternalLinks(extractor, text):
+    return replaceExternalLinks(text)
+
 
+def cleanInternalLinks(extractor, text):
+    text = replaceInternalLinks(text, extractor.args.acceptedNamespaces)
     # drop MagicWords behavioral switches
-    text = magic_words_regex.sub('', text)
+    return magic_words_regex.sub('', text)
 
+
+def cleanUnescapeMarkup(extractor, text):
     # turn into HTML, except for the content of <syntaxhighlight>
-    res = ''
+    res = []
     cur = 0
     for m in syntax_highlight_regex.finditer(text):
-        end = m.end()
-        res += unescape(text[cur:m.start()]) + m.group(1)
-        cur = end
-    text = res + unescape(text[cur:])
+        res.append(unescape(text[cur:m.start()]))
+        res.append(m.group(1))
+        cur = m.end()
+    res.append(unescape(text[cur:]))
+    return ''.join(res)
 
-    text = bold_italic.sub(r'\1', text)
-    text = bold.sub(r'\1', text)
-    text = italic_quote.sub(r'"\1"', text)
-    text = italic.sub(r'"\1"', text)
-    text = quote_quote.sub(r'"\1"', text)
 
-    # residuals of unbalanced quotes
-    text = text.replace("'''", '').replace("''", '"')
+def cleanQuotes(extractor, text):
+    # bold, italic and quotes
+    if "''" in text or '""' in text:
+        for delimiters in quote_delimiters:
+            text = replaceQuoted(text, *delimiters)
 
-    # Collect spans
-    spans = []
-    # Drop HTML comments
-    for m in comment.finditer(text):
-        spans.append((m.start(), m.end()))
+    # residuals of unbalanced quotes
+    return text.replace("'''", '').replace("''", '"')
 
-    # Drop self-closing tags
-    for pattern in selfClosing_tag_patterns:
-        for m in pattern.finditer(text):
-            spans.append((m.start(), m.end()))
 
-    # Drop ignored tags
-    for left, right in ignored_tag_patterns:
-        for m in left.finditer(text):
-            spans.append((m.start(), m.end()))
-        for m in right.finditer(text):
-            spans.append((m.start(), m.end()))
+def cleanSpans(extractor, text):
+    # Drop HTML comments, self-closing tags and ignored tags
+    spans = markupSpans(text)
 
     # Bulk remove all spans
-    text = dropSpans(spans, text)
+    return dropSpans(spans, text)
 
-    # Drop discarded elements
-    for tag in discardElements:
-        text = dropNested(text, r'<\s*%s\b[^>/]*>' % tag, r'<\s*/\s*%s>' % tag)
 
-    text = unescape(text)
+def cleanDiscarded(extractor, text):
+    return dropDiscarded(text)
 
-    # Expand placeholders
-    for pattern, placeholder in placeholder_tag_patterns:
-        index = 1
-        for match in pattern.finditer(text):
-            text = text.replace(match.group(), '%s_%d' % (placeholder, index))
-            index += 1
 
+def cleanUnescapeText(extractor, text):
+    return unescape(text)
+
+
+def cleanPlaceholders(extractor, text):
+    return expandPlaceholders(text)
+
+
+def cleanPunctuation(extractor, text):
     text = text.replace('<<', u'«').replace('>>', u'»')
 
     # Cleanup text
@@ -101,6 +107,62 @@ def clean(extractor, text):
     return text
 
 
+# The stages of clean(), as (name, function(extractor, text))
+clean_stages = [
+    ('templates_tables', cleanNested),
+    ('external_links', cleanExternalLinks),
+    ('internal_links', cleanInternalLinks),
+    ('unescape_markup', cleanUnescapeMarkup),
+    ('quotes', cleanQuotes),
+    ('spans', cleanSpans),
+    ('discarded', cleanDiscarded),
+    ('unescape_text', cleanUnescapeText),
+    ('placeholders', cleanPlaceholders),
+    ('punctuation', cleanPunctuation),
+]
+
+
+def fallbackClean(extractor, text):
+    """
+    Cheaper cleaning of wiki markup, in time linear in the length of text,
+    for pages on which clean() takes too long: templates, tables, comments
+    and tags are dropped, links replaced by their labels and quotes by
+    plain ones, but discarded elements and placeholders are not handled.
+    """
+    text = dropNestedBlocks(text, nested_block_delimiters)
+    text = unescape(text)
+
+    # comments, scanned by str.find() rather than a lazy regex
+    res = []
+    cur = 0
+    while True:
+        start = text.find('<!--', cur)
+        if start < 0:
+            break
+        res.append(text[cur:start])
+        end = text.find('-->', start + 4)
+        cur = len(text) if end < 0 else end + 3
+    res.append(text[cur:])
+    text = ''.join(res)
+
+    text = fallback_tag.sub('', text)
+
+    def internalLink(m):
+        title = m.group(1)
+        return makeInternalLink(title, m.group(2) or title, extractor.args.acceptedNamespaces)
+
+    # twice, for links within the label of images
+    for _ in range(2):
+        text = fallback_internal_link.sub(internalLink, text)
+    text = fallback_external_link.sub(lambda m: m.group(1).strip(), text)
+    text = text.replace("'''", '').replace("''", '"')
+    text = text.replace('\t', ' ')
+    text = spaces.sub(' ', text)
+    if extractor.args.escape_doc:
+        text = html.escape(text)
+    return text
+
+
 def compact(text, mark_headers=False):
     """
     Deal with headers, lists, empty sections, residuals of tables.
@@ -178,27 +240,142 @@ def compact(text, mark_headers=False):
 
     return page
 
+def markupSpans(text):
+    """
+    Collect the spans of HTML comments, self-closing tags and ignored tags.
+    """
+    spans = []
+    for m in markup_regex.finditer(text):
+        if m.lastindex is None and '<!--' in m.group():
+            # a comment opened within a tag may extend past it: scan separately
+            return markupSpansByPattern(text)
+        spans.append(m.span())
+    return spans
+
+def markupSpansByPattern(text):
+    spans = []
+    # HTML comments
+    for m in comment.finditer(text):
+        spans.append((m.start(), m.end()))
+
+    # self-closing tags
+    for pattern in selfClosing_tag_patterns:
+        for m in pattern.finditer(text):
+            spans.append((m.start(), m.end()))
+
+    # ignored tags
+    for left, right in ignored_tag_patterns:
+        for m in left.finditer(text):
+            spans.append((m.start(), m.end()))
+        for m in right.finditer(text):
+            spans.append((m.start(), m.end()))
+    return spans
+
+def replaceQuoted(text, open, close, stop, quote):
+    """
+    Replace each :param open: content :param close: with quote content quote,
+    where content is the shortest text not containing :param stop:, like
+    re.sub(open + '([^' + stop + ']*?)' + close, quote + r'\1' + quote, text),
+    but in a single forward scan.
+    """
+    find = text.find
+    openSize = len(open)
+    closeSize = len(close)
+    rewriter = None
+    pos = 0
+    q = s = 0  # next close and stop, kept while ahead of the search
+    while True:
+        p = find(open, pos)
+        if p < 0:
+            break
+        content = p + openSize
+        if 0 <= q < content:
+            q = find(close, content)
+        if q < 0:  # no more matches
+            break
+        if 0 <= s < content:
+            s = find(stop, content)
+        if s < 0 or s >= q:
+            if rewriter is None:
+                rewriter = Rewriter(text)
+            rewriter.replace(p, q + closeSize, quote + text[content:q] + quote)
+            pos = q + closeSize
+        else:
+            pos = p + 1  # retry from the next char, as the regex would
+    return rewriter.result() if rewriter else text
+
+class Rewriter:
+    """
+    Collects the edits of a pass over a text, as (start, end, replacement),
+    and builds the resulting text with a single join.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.pieces = []
+        self.offset = 0  # end of the last edit
+
+    def replace(self, start, end, replacement=''):
+        """
+        Replace text[start:end]. Edits must come in text order, not overlapping.
+        """
+        if self.offset < start:
+            self.pieces.append(self.text[self.offset:start])
+        if replacement:
+            self.pieces.append(replacement)
+        self.offset = end
+
+    def result(self):
+        if not self.pieces:
+            return self.text[self.offset:]
+        self.pieces.append(self.text[self.offset:])
+        return ''.join(self.pieces)
+
+def expandPlaceholders(text):
+    """
+    Replace math and code elements with placeholders, e.g. formula_1.
+    Each element replaces all the occurrences of its text, numbering the
+    placeholders by the position of the element.
+    """
+    for pattern, placeholder in placeholder_tag_patterns:
+        matches = list(pattern.finditer(text))
+        if not matches:
+            continue
+        opening = placeholder_open_patterns[placeholder]
+        if any(placeholder in m.group() or opening.search(m.group(), 1) for m in matches):
+            # element text may also occur across elements, or result from
+            # earlier replacements: replace one at a time
+            for index, match in enumerate(matches, 1):
+                text = text.replace(match.group(), '%s_%d' % (placeholder, index))
+            continue
+        # element texts occur only as elements: replace them in one pass
+        names = {}
+        rewriter = Rewriter(text)
+        for index, match in enumerate(matches, 1):
+            name = names.setdefault(match.group(), '%s_%d' % (placeholder, index))
+            rewriter.replace(match.start(), match.end(), name)
+        text = rewriter.result()
+    return text
+
 def dropSpans(spans, text):
     """
     Drop from text the blocks identified in :param spans:, possibly nested.
     """
     spans.sort()
-    res = ''
-    offset = 0
+    rewriter = Rewriter(text)
     for s, e in spans:
-        if offset <= s:  # handle nesting
-            if offset < s:
-                res += text[offset:s]
-            offset = e
-    res += text[offset:]
-    return res
+        if rewriter.offset <= s:  # handle nesting
+            rewriter.replace(s, e)
+    return rewriter.result()
 
 def dropNested(text, openDelim, closeDelim):
     """
     A matching function for nested expressions, e.g. namespaces and tables.
+    :param openDelim: regex, or compiled pattern, of the opening delimiter.
+    :param closeDelim: regex, or compiled pattern, of the closing delimiter.
     """
-    openRE = re.compile(openDelim, re.IGNORECASE)
-    closeRE = re.compile(closeDelim, re.IGNORECASE)
+    openRE = re.compile(openDelim, re.IGNORECASE) if isinstance(openDelim, str) else openDelim
+    closeRE = re.compile(closeDelim, re.IGNORECASE) if isinstance(closeDelim, str) else closeDelim
 
     # partition text in separate blocks { } { }
     spans = []  # pairs (s, e) for each partition
@@ -251,14 +428,99 @@ def dropNested(text, openDelim, closeDelim):
     # collect text outside partitions
     return dropSpans(spans, text)
 
+def dropDiscarded(text):
+    """
+    Drop the elements of the tags in discardElements, with their content.
+    A single scan finds which tags occur, and only those are dropped, tag by
+    tag, rescanning after each change since dropping text can join a new tag.
+    """
+    present = {tag.lower() for tag in discard_regex.findall(text)}
+    if not present:
+        return text
+    for tag, openRE, closeRE in discard_tag_patterns:
+        if tag in present:
+            dropped = dropNested(text, openRE, closeRE)
+            if dropped != text:
+                text = dropped
+                present = {tag.lower() for tag in discard_regex.findall(text)}
+    return text
+
+def dropNestedBlocks(text, delimiters):
+    """
+    Drop nested blocks with literal delimiters, e.g. templates and tables.
+    Equivalent to dropNested() on each pair in turn, but scanning with str.find().
+    :param delimiters: list of pairs (open, close).
+    """
+    for openDelim, closeDelim in delimiters:
+        if openDelim in text:
+            spans = nestedSpans(text, openDelim, closeDelim)
+            if spans:
+                text = dropSpans(spans, text)
+    return text
+
+def nestedSpans(text, openDelim, closeDelim):
+    """
+    The partition of text in separate blocks { } { } done by dropNested(),
+    for literal delimiters.
+    :return: the list of spans (s, e) of the blocks.
+    """
+    find = text.find
+    openSize = len(openDelim)
+    closeSize = len(closeDelim)
+    spans = []  # pairs (s, e) for each partition
+    nest = 0  # nesting level
+    start = find(openDelim)
+
+    # if there is not nested block
+    if start < 0:
+        return spans
+
+    end = find(closeDelim, start + openSize)
+    next = start
+
+    while end >= 0:
+        next = find(openDelim, next + openSize)
+        if next < 0:  # termination
+            while nest:  # close all pending
+                nest -= 1
+                end0 = find(closeDelim, end + closeSize)
+                if end0 >= 0:
+                    end = end0
+                else:
+                    break
+            spans.append((start, end + closeSize))
+            break
+        while end + closeSize < next:
+            # { } {
+            if nest:
+                nest -= 1
+                # try closing more
+                last = end + closeSize
+                end = find(closeDelim, last)
+                if end < 0:  # unbalanced
+                    if spans:
+                        span = (spans[0][0], last)
+                    else:
+                        span = (start, last)
+                    spans = [span]
+                    break
+            else:
+                spans.append((start, end + closeSize))
+                # advance start, find next close
+                start = next
+                end = find(closeDelim, next + openSize)
+                break  # { }
+        if next != start:
+            # { { }
+            nest += 1
+
+    return spans
+
 def replaceExternalLinks(text):
-    s = ''
-    cur = 0
+    rewriter = Rewriter(text)
     for m in ExtLinkBracketedRegex.finditer(text):
-        s += text[cur:m.start()]
-        cur = m.end()
-        s += m.group(3)
-    return s + text[cur:]
+        rewriter.replace(m.start(), m.end(), m.group(3))
+    return rewriter.result()
 
 def replaceInternalLinks(text, acceptedNamespaces):
     """
@@ -269,8 +531,7 @@ def replaceInternalLinks(text, acceptedNamespaces):
     """
     # call this after removal of external links, so we need not worry about
     # triple closing ]]].
-    cur = 0
-    res = ''
+    rewriter = Rewriter(text)
     for s, e in findBalanced(text, ['[['], [']]']):
         m = tail_regex.match(text, e)
         if m:
@@ -295,9 +556,8 @@ def replaceInternalLinks(text, acceptedNamespaces):
                     pipe = last  # advance
                 curp = e1
             label = inner[pipe + 1:].strip()
-        res += text[cur:s] + makeInternalLink(title, label, acceptedNamespaces) + trail
-        cur = end
-    return res + text[cur:]
+        rewriter.replace(s, end, makeInternalLink(title, label, acceptedNamespaces) + trail)
+    return rewriter.result()
 
 def makeInternalLink(title, label, acceptedNamespaces):
     colon = title.find(':')
@@ -328,27 +588,129 @@ def unescape(text):
                     return chr(int(code))
             else:  # named entity
                 return chr(name2codepoint[code])
-        except:
+        except (ValueError, KeyError, OverflowError, IndexError):
             return text  # leave as is
 
     text = html.unescape(text)
     text = re.sub("&#?(\w+);", fixup, text)
     return text
 
+class StageStats:
+    """
+    Cumulative wall time, calls, and characters in and out of each stage of
+    the extraction, in a process. The statistics of the processes are
+    merged with add().
+    """
+
+    def __init__(self):
+        self.stages = {}  # name -> [seconds, calls, chars in, chars out]
+
+    def run(self, name, stage, *args):
+        """
+        Call stage(*args), whose last argument is the text, and record it.
+        :return: the result of stage.
+        """
+        start = time.perf_counter()
+        result = stage(*args)
+        self.record(name, time.perf_counter() - start, len(args[-1]), len(result))
+        return result
+
+    def record(self, name, seconds, chars_in, chars_out):
+        counters = self.stages.get(name)
+        if counters is None:
+            counters = self.stages[name] = [0.0, 0, 0, 0]
+        counters[0] += seconds
+        counters[1] += 1
+        counters[2] += chars_in
+        counters[3] += chars_out
+
+    def add(self, other):
+        for name, (seconds, calls, chars_in, chars_out) in other.stages.items():
+            counters = self.stages.setdefault(name, [0.0, 0, 0, 0])
+            counters[0] += seconds
+            counters[1] += calls
+            counters[2] += chars_in
+            counters[3] += chars_out
+
+    def table(self):
+        """
+        :return: the lines of a table of the stages, in the order they were first run.
+        """
+        total = sum(counters[0] for counters in self.stages.values()) or 1.0
+        lines = ['%-18s %10s %10s %6s %14s %14s %9s' % (
+            'stage', 'calls', 'seconds', '%', 'chars in', 'chars out', 'Mchar/s')]
+        for name, (seconds, calls, chars_in, chars_out) in self.stages.items():
+            lines.append('%-18s %10d %10.2f %6.1f %14d %14d %9.1f' % (
+                name, calls, seconds, 100 * seconds / total, chars_in, chars_out,
+                chars_in / 1e6 / seconds if seconds else 0.0))
+        return lines
+
+
+class SlowPages:
+    """
+    The pages that took longest to extract, in a process, as a heap of
+    (seconds, id, title, characters). The pages of the processes are
+    merged with add().
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.heap = []
+
+    def record(self, seconds, id, title, chars):
+        if len(self.heap) < self.count:
+            heapq.heappush(self.heap, (seconds, id, title, chars))
+        elif seconds > self.heap[0][0]:
+            heapq.heapreplace(self.heap, (seconds, id, title, chars))
+
+    def add(self, other):
+        for page in other.heap:
+            self.record(*page)
+
+    def table(self):
+        """
+        :return: the lines of a table of the pages, slowest first.
+        """
+        lines = ['%10s %12s %12s  %s' % ('seconds', 'id', 'chars', 'title')]
+        for seconds, id, title, chars in sorted(self.heap, reverse=True):
+            lines.append('%10.3f %12s %12d  %s' % (seconds, id, chars, title))
+        return lines
+
+
 class Extractor:
     """
     An extraction task on a article.
+    A worker can keep a single Extractor and reset() it for each page, or
+    call extract_pages(), so that the state common to all pages is built once.
     """
 
-    def __init__(self, args, id, title, page):
+    def __init__(self, args, id=None, title=None, page=None):
         """
-        :param page: a list of lines.
+        :param page: the text of the page.
         """
         self.args = args
+        self.magicWords = MagicWords()
+        now = time.localtime()
+        self.magicWords['currentyear'] = time.strftime('%Y', now)
+        self.magicWords['currentmonth'] = time.strftime('%m', now)
+        self.magicWords['currentday'] = time.strftime('%d', now)
+        self.magicWords['currenthour'] = time.strftime('%H', now)
+        self.magicWords['currenttime'] = time.strftime('%H:%M:%S', now)
+        self.out = None  # memory file reused by extract_pages()
+        self.cache = None  # TextCache of cleaned text, if any
+        self.stage_stats = None  # StageStats timing the stages of cleaning, if any
+        self.slow_pages = None  # SlowPages recording the slowest pages, if any
+        self.reset(id, title, page)
+
+    def reset(self, id, title, page):
+        """
+        Prepare for the extraction of another page.
+        """
         self.id = id
         self.title = title
         self.page = page
-        self.magicWords = MagicWords()
+        self.magicWords['pagename'] = title
+        self.magicWords['fullpagename'] = title
         self.frame = []
         self.recursion_exceeded_1_errs = 0  # template recursion within expandTemplates()
         self.recursion_exceeded_2_errs = 0  # template recursion within expandTemplate()
@@ -360,17 +722,16 @@ class Extractor:
         :param mark_headers: True to distinguish headers from paragraphs
           e.g. "## Section 1"
         """
-        self.magicWords['pagename'] = self.title
-        self.magicWords['fullpagename'] = self.title
-        self.magicWords['currentyear'] = time.strftime('%Y')
-        self.magicWords['currentmonth'] = time.strftime('%m')
-        self.magicWords['currentday'] = time.strftime('%d')
-        self.magicWords['currenthour'] = time.strftime('%H')
-        self.magicWords['currenttime'] = time.strftime('%H:%M:%S')
-
         text = clean(self, text)
 
-        text = compact(text, mark_headers=mark_headers)
+        if self.stage_stats is None:
+            text = compact(text, mark_headers=mark_headers)
+        else:
+            start = time.perf_counter()
+            chars = len(text)
+            text = compact(text, mark_headers=mark_headers)
+            self.stage_stats.record('compact', time.perf_counter() - start, chars,
+                                    sum(len(line) for line in text))
         return text
 
     def extract(self, out):
@@ -378,7 +739,7 @@ class Extractor:
         :param out: a memory file.
         """
         logging.debug("%s\t%s", self.id, self.title)
-        text = ''.join(self.page)
+        text = self.page
 
         header = ""
         footer = ""
@@ -391,7 +752,16 @@ class Extractor:
             footer = "\n</doc>\n"
             out.write(header)
 
-        text = self.clean_text(text)
+        if self.cache is None:
+            text = self.clean_text(text)
+        else:
+            key = self.cache.key(text)
+            cleaned = self.cache.get(key)
+            if cleaned is None:
+                text = self.clean_text(text)
+                self.cache.put(key, '\n'.join(text))
+            else:
+                text = cleaned.split('\n')
 
         if not self.args.keep_doc_tag:
             out.write(self.title.strip() + ". ")
@@ -413,6 +783,30 @@ class Extractor:
             logging.warn("Template errors in article '%s' (%s): title(%d) recursion(%d, %d, %d)",
                          self.title, self.id, *errs)
 
+    def extract_pages(self, pages):
+        """
+        Extract pages one after the other.
+        :param pages: iterable of (id, title, page).
+        :return: the list of the extracted texts.
+        """
+        if self.out is None:
+            self.out = StringIO()
+        out = self.out
+        texts = []
+        for page in pages:
+            self.reset(*page)
+            out.seek(0)
+            out.truncate()
+            if self.slow_pages is None:
+                self.extract(out)
+            else:
+                start = time.perf_counter()
+                self.extract(out)
+                self.slow_pages.record(time.perf_counter() - start, self.id, self.title,
+                                       len(self.page))
+            texts.append(out.getvalue())
+        return texts
+
 
 def findBalanced(text, openDelim, closeDelim):
     """
@@ -422,6 +816,9 @@ def findBalanced(text, openDelim, closeDelim):
     :return: an iterator producing pairs (start, end) of start and end
     positions in text containing a balanced expression.
     """
+    if len(openDelim) == 1:
+        yield from findBalancedPair(text, openDelim[0], closeDelim[0])
+        return
     openPat = '|'.join([re.escape(x) for x in openDelim])
     # patter for delimiters expected after each opening delimiter
     afterPat = {o: re.compile(openPat + '|' + c, re.DOTALL) for o, c in zip(openDelim, closeDelim)}
@@ -454,3 +851,43 @@ def findBalanced(text, openDelim, closeDelim):
                 start = next.end()
                 startSet = False
         cur = next.end()
+
+
+def findBalancedPair(text, openDelim, closeDelim):
+    """
+    findBalanced() for a single pair of literal delimiters, scanning text with
+    str.find().
+    """
+    find = text.find
+    openSize = len(openDelim)
+    closeSize = len(closeDelim)
+    nextOpen = find(openDelim)
+    nextClose = -1
+    end = len(text)  # nextClose once closeDelim is exhausted, not to search again
+    depth = 0
+    start = 0
+    cur = 0
+    while True:
+        if nextOpen >= 0 and nextOpen < cur:
+            nextOpen = find(openDelim, cur)
+        if depth == 0:
+            if nextOpen < 0:
+                return
+            start = nextOpen
+            depth = 1
+            cur = nextOpen + openSize
+            continue
+        if nextClose < cur:
+            nextClose = find(closeDelim, cur)
+            if nextClose < 0:
+                nextClose = end
+        if nextOpen >= 0 and nextOpen <= nextClose:
+            depth += 1
+            cur = nextOpen + openSize
+        elif nextClose < end:
+            depth -= 1
+            cur = nextClose + closeSize
+            if depth == 0:
+                yield start, cur
+        else:
+            return
@@ -0,0 +1,322 @@
+import bz2
+import codecs
+import gzip
+import logging
+import os
+import zlib
+from collections import deque
+from multiprocessing import Pool, Process, Queue
+
+from wikiextractor.reader import read_bytes
+
+# bz2 block and end of stream markers (48 bits, not byte aligned)
+BZ2_BLOCK_MAGIC = 0x314159265359
+BZ2_EOS_MAGIC = 0x177245385090
+MAGIC_BITS = 48
+
+SCAN_SIZE = 64 * 1024 * 1024  # bytes of compressed input scanned at a time
+GZIP_JOB_SIZE = 4 * 1024 * 1024  # compressed bytes of gzip members per job
+# compressed bytes of a gzip member beyond which the file is not decompressed in parallel,
+# since each member is decompressed in memory
+GZIP_MAX_MEMBER = 64 * 1024 * 1024
+
+
+def magic_shifts(magic):
+    """
+    For each bit shift 0..7 of :param magic: within a byte, the bytes that are
+    fully covered by it, used to search candidates with bytes.find().
+    :return: list of (shift, offset of the covered bytes, covered bytes)
+    """
+    shifts = []
+    for shift in range(8):
+        # magic placed at bit :shift: of a 7 bytes window
+        window = magic << (56 - MAGIC_BITS - shift)
+        data = window.to_bytes(7, 'big')
+        first = 1 if shift else 0
+        shifts.append((shift, first, data[first:first + 5]))
+    return shifts
+
+
+def bits_at(data, bit, count):
+    """
+    Value of :param count: bits of :param data: starting at bit offset :param bit:.
+    """
+    start = bit // 8
+    end = (bit + count + 7) // 8
+    value = int.from_bytes(data[start:end], 'big')
+    return (value >> (8 * (end - start) - (bit % 8) - count)) & ((1 << count) - 1)
+
+
+def find_bz2_blocks(filename):
+    """
+    Scan a bz2 file for block boundaries.
+    :return: the sorted list of (bit offset, is_block) of every block and
+    end of stream marker.
+    """
+    markers = {}
+    searches = [(magic, magic_shifts(magic)) for magic in (BZ2_BLOCK_MAGIC, BZ2_EOS_MAGIC)]
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        pos = 0
+        while pos < size:
+            # overlap chunks by a window, so that no marker is split
+            f.seek(pos)
+            data = f.read(SCAN_SIZE + 8)
+            for magic, shifts in searches:
+                for shift, first, pattern in shifts:
+                    i = data.find(pattern)
+                    while i >= 0:
+                        bit = (i - first) * 8 + shift
+                        if bit >= 0 and bits_at(data, bit, MAGIC_BITS) == magic:
+                            markers[pos * 8 + bit] = magic == BZ2_BLOCK_MAGIC
+                        i = data.find(pattern, i + 1)
+            pos += SCAN_SIZE
+    return sorted(markers.items())
+
+
+def decode_bz2_block(filename, start, end):
+    """
+    Decompress the bz2 block between bit offsets :param start: and :param end:,
+    by wrapping it into a stream of its own.
+    :return: the decompressed bytes, or None if the range is not a valid block.
+    """
+    data = read_bytes(filename, start // 8, (end + 7) // 8)
+    nbits = end - start
+    block = bits_at(data, start % 8, nbits)
+    crc = bits_at(data, start % 8 + MAGIC_BITS, 32)
+    # block, end of stream marker, combined CRC (the block CRC), padding
+    stream = (((block << MAGIC_BITS) | BZ2_EOS_MAGIC) << 32) | crc
+    nbits += MAGIC_BITS + 32
+    pad = -nbits % 8
+    stream = b'BZh9' + (stream << pad).to_bytes((nbits + pad) // 8, 'big')
+    try:
+        return bz2.decompress(stream)
+    except (OSError, ValueError):
+        return None
+
+
+def read_gzip_index(filename, index_file=None):
+    """
+    Offsets of the members of a gzip file, from its prebuilt seek index
+    :param index_file: (default filename + '.idx'), which is created on first
+    use, if it can be written.
+    :return: the list of offsets, or None if a member is larger than
+    GZIP_MAX_MEMBER (e.g. a file of a single member), found without reading
+    further.
+    """
+    index_file = index_file or filename + '.idx'
+    if os.path.exists(index_file):
+        with open(index_file) as f:
+            return [int(line) for line in f]
+    logging.info("Building seek index %s", index_file)
+    offsets = []
+    with open(filename, 'rb') as f:
+        pos = 0
+        decomp = None
+        while True:
+            data = f.read(1024 * 1024)
+            if not data:
+                break
+            while data:
+                if decomp is None:
+                    offsets.append(pos)
+                    decomp = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                decomp.decompress(data)
+                if decomp.eof:
+                    used = len(data) - len(decomp.unused_data)
+                    data = decomp.unused_data
+                    decomp = None
+                else:
+                    used = len(data)
+                    data = b''
+                pos += used
+                if pos - offsets[-1] > GZIP_MAX_MEMBER:
+                    return None
+    try:
+        with open(index_file, 'w') as f:
+            f.writelines('%d\n' % offset for offset in offsets)
+    except OSError as e:
+        logging.warning("Cannot write seek index %s (%s): it will be built again", index_file, e)
+    return offsets
+
+
+def decode_gzip_members(filename, start, end):
+    return gzip.decompress(read_bytes(filename, start, end))
+
+
+def decode(job):
+    """
+    Pool task: decompress one piece of the input.
+    """
+    kind, filename, start, end = job
+    if kind == 'bz2':
+        return decode_bz2_block(filename, start, end)
+    return decode_gzip_members(filename, start, end)
+
+
+def decode_chunks(chunks):
+    """
+    Decode UTF-8 :param chunks: of bytes, possibly splitting characters.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def split_lines(chunks):
+    """
+    The lines of a text given as a sequence of :param chunks:.
+    """
+    rest = ''
+    for chunk in chunks:
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if rest:
+        yield rest
+
+
+class ParallelDecompressor(object):
+    """
+    Iterator over the lines of a bz2 or gzip file, whose blocks (resp. members)
+    are decompressed by a pool of processes and reassembled in order.
+    jobs is None for gzip files of a single member, or with members too
+    large to be decompressed in memory, which must be read serially instead.
+    """
+
+    def __init__(self, filename: str, processes: int, index_file: str = None) -> None:
+        """
+        :param index_file: seek index of a gzip file (default filename + '.idx').
+        """
+        self.filename = filename
+        self.index_file = index_file
+        self.processes = processes
+        self.pool = None
+        ext = os.path.splitext(filename)[1]
+        if ext == '.bz2':
+            self.jobs = self.bz2_jobs()
+        elif ext == '.gz':
+            self.jobs = self.gzip_jobs()
+        else:
+            raise ValueError('Parallel decompression requires a .bz2 or .gz file')
+        self.lines = self.iter_lines()
+
+    def bz2_jobs(self) -> list:
+        markers = find_bz2_blocks(self.filename)
+        return [('bz2', self.filename, start, end)
+                for (start, is_block), (end, _) in zip(markers, markers[1:]) if is_block]
+
+    def gzip_jobs(self) -> list:
+        offsets = read_gzip_index(self.filename, self.index_file)
+        if offsets is None or len(offsets) == 1:
+            return None  # not worth a pool
+        offsets.append(os.path.getsize(self.filename))
+        jobs = []
+        start = offsets[0]
+        for end in offsets[1:]:
+            if end - start >= GZIP_JOB_SIZE or end == offsets[-1]:
+                jobs.append(('gzip', self.filename, start, end))
+                start = end
+        return jobs
+
+    def iter_chunks(self):
+        """
+        Decompressed pieces, in file order, keeping at most twice as many
+        pending as processes.
+        """
+        self.pool = Pool(self.processes)
+        pending = deque()
+        jobs = iter(self.jobs)
+
+        def submit():
+            job = next(jobs, None)
+            if job is not None:
+                pending.append((job, self.pool.apply_async(decode, (job,))))
+
+        for _ in range(2 * self.processes):
+            submit()
+        while pending:
+            job, result = pending.popleft()
+            data = result.get()
+            submit()
+            while data is None:
+                # a spurious block marker split a block: merge it with the next one
+                if not pending:
+                    raise IOError('Invalid bz2 block in %s at bit %d' % (self.filename, job[2]))
+                next_job, _ = pending.popleft()
+                submit()
+                job = ('bz2', self.filename, job[2], next_job[3])
+                data = decode(job)
+            yield data
+
+    def iter_lines(self):
+        return split_lines(decode_chunks(self.iter_chunks()))
+
+    def __iter__(self):
+        return self.lines
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+
+# ----------------------------------------------------------------------
+# Decoding process
+
+OPENERS = {'.bz2': bz2.open, '.gz': gzip.open}
+
+
+def decode_file(filename, read_size, queue):
+    """
+    Process reading a (possibly compressed) file by :param read_size: bytes
+    of content, and putting them decoded into :param queue:, followed by
+    None, or by an exception if reading fails.
+    """
+    try:
+        opener = OPENERS.get(os.path.splitext(filename)[1], open)
+        with opener(filename, 'rb') as f:
+            for text in decode_chunks(iter(lambda: f.read(read_size), b'')):
+                if text:
+                    queue.put(text)
+        queue.put(None)
+    except Exception as e:
+        queue.put(e)
+
+
+class DecodingReader(object):
+    """
+    Iterator over the lines of a (possibly compressed) file, decompressed and
+    decoded by a separate process, which passes chunks of text ahead through
+    a bounded queue.
+    """
+
+    def __init__(self, filename: str, read_size: int, buffered: int = 8) -> None:
+        """
+        :param read_size: bytes of content in each chunk.
+        :param buffered: max number of chunks decoded ahead.
+        """
+        self.queue = Queue(maxsize=buffered)
+        self.process = Process(target=decode_file, args=(filename, read_size, self.queue))
+        self.process.daemon = True
+        self.process.start()
+        self.lines = split_lines(self.iter_chunks())
+
+    def iter_chunks(self):
+        while True:
+            text = self.queue.get()
+            if text is None:
+                break
+            if isinstance(text, Exception):
+                raise IOError('Decoding failed: %s' % text)
+            yield text
+
+    def __iter__(self):
+        return self.lines
+
+    def close(self) -> None:
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
@@ -2,10 +2,12 @@ import os
 import sys
 import argparse
 import logging
+import signal
 from multiprocessing import cpu_count
 
 from wikiextractor.process import process_dump
 from wikiextractor.utils import size2integer
+from wikiextractor.writer import CHECKPOINT, CODECS, PAGE_MANIFEST, read_checkpoint
 
 # constants
 FORMAT_LOGGING = '%(levelname)s: %(message)s'
@@ -37,6 +39,26 @@ def main():
     parser.add_argument("input_file",
                         help="XML wiki dump file")
 
+    groupI = parser.add_argument_group('Input')
+    groupI.add_argument("--multistream_index", default=None, metavar="INDEX",
+                        help="index file (-index.txt.bz2) of a multistream bz2 dump: "
+                        "its streams are decompressed in parallel by the extract processes")
+    groupI.add_argument("--decompress_processes", type=int, default=0, metavar="N",
+                        help="decompress the blocks of a bz2 dump (or the members of a gzip dump) "
+                        "with N processes (default: serial decompression)")
+    groupI.add_argument("--gzip_index", default=None, metavar="FILE",
+                        help="seek index of the members of a gzip dump for --decompress_processes, "
+                        "built on first use (default: <dump>.idx)")
+    groupI.add_argument("--decode_process", action="store_true",
+                        help="decompress and decode the dump in a separate process, "
+                        "which passes chunks of text ahead to the mapper")
+    groupI.add_argument("--read_size", default="1M", metavar="n[KMG]",
+                        help="bytes of text in each chunk passed by the decode process "
+                        "(default %(default)s)")
+    groupI.add_argument("--split_input", action="store_true",
+                        help="memory-map an uncompressed dump and let the extract processes "
+                        "scan byte ranges of it for pages")
+
     groupO = parser.add_argument_group('Output')
     groupO.add_argument("-o", "--output", default="text",
                         help="directory for extracted files (or '-' for dumping to stdout)")
@@ -45,17 +67,91 @@ def main():
                         metavar="n[KMG]")
     groupO.add_argument("-c", "--compress", action="store_true",
                         help="compress output files using bzip")
+    groupO.add_argument("--compression", choices=sorted(CODECS), default=None,
+                        help="compress output files with this codec (implies -c)")
+    groupO.add_argument("--compression_level", type=int, default=None, metavar="N",
+                        help="compression level (default: that of the codec)")
+    groupO.add_argument("--compression_threads", type=int, default=1, metavar="N",
+                        help="compress output with N threads, while the writer fills the next "
+                        "chunks (default %(default)s)")
     groupO.add_argument("-k", "--keep_doc_tag", action="store_true",
                         help="keep document tag in output")
+    groupO.add_argument("--shard_per_worker", action="store_true",
+                        help="let each extract process write its own files, in OUTPUT/worker_NN, "
+                        "with a manifest.tsv of the batches of articles they contain")
+    groupO.add_argument("--page_manifest", action="store_true",
+                        help="record the revision and output location of each article "
+                        "in OUTPUT/pages.tsv")
+    groupO.add_argument("--previous", default=None, metavar="DIR",
+                        help="output directory of a previous run with a page manifest: "
+                        "the articles with the same revision are copied from it, not extracted "
+                        "(implies --page_manifest)")
+    groupO.add_argument("--doc_index", action="store_true",
+                        help="record the location of each article in OUTPUT/docs.tsv")
+    groupO.add_argument("--checkpoint", type=int, default=0, metavar="SECONDS",
+                        help="record every SECONDS in OUTPUT/checkpoint.json what was written, "
+                        "so that an interrupted run can be resumed")
+    groupO.add_argument("--resume", action="store_true",
+                        help="continue the run interrupted after the last checkpoint in OUTPUT, "
+                        "with the same arguments")
 
     groupP = parser.add_argument_group('Processing')
     groupP.add_argument("-ns", "--namespaces", default="", metavar="ns1,ns2",
                         help="accepted namespaces")
     groupP.add_argument("--escape_doc", action="store_true",
                         help="use to escape the contents of the output <doc>...</doc>")
+    groupP.add_argument("--cache", default=None, metavar="FILE",
+                        help="SQLite database keeping the cleaned text of articles, "
+                        "reused by later extractions of the same wikitext with the same arguments")
+    groupP.add_argument("--cache_size", default="10G", metavar="n[KMG]",
+                        help="maximum size of the texts in the cache, beyond which the least "
+                        "recently used are evicted (default %(default)s)")
+    groupP.add_argument("--page_budget", type=float, default=0, metavar="SECONDS",
+                        help="CPU time allowed to extract a page, beyond which it is cleaned again "
+                        "by a cheaper cleaner, linear in its size (default 0: no limit)")
+    groupP.add_argument("--quarantine", default=None, metavar="DIR",
+                        help="write to DIR the wikitext of the pages over budget with the cheaper "
+                        "cleaner too, as <id>.wiki, and the report of all pages over budget")
+    groupP.add_argument("--profile_stages", action="store_true",
+                        help="time the stages of cleaning in each extract process and log "
+                        "their merged table at the end")
+    groupP.add_argument("--profile_dir", default=None, metavar="DIR",
+                        help="directory where each extract process dumps its cProfile "
+                        "statistics, as extract_<pid>.prof")
+    groupP.add_argument("--metrics_file", default=None, metavar="FILE",
+                        help="write periodically the metrics of the extraction to FILE, in the "
+                        "Prometheus text format (e.g. for the textfile collector of node_exporter)")
+    groupP.add_argument("--metrics_port", type=int, default=0, metavar="PORT",
+                        help="serve the metrics of the extraction on http://127.0.0.1:PORT/metrics")
+    groupP.add_argument("--metrics_interval", type=float, default=10, metavar="SECONDS",
+                        help="seconds between writes of the metrics file (default %(default)s)")
 
     parser.add_argument("--processes", type=int, default=cpu_count(),
                         help="Number of processes to use (default %(default)s)")
+    parser.add_argument("--batch_size", default="64K", metavar="n[KMG]",
+                        help="approximate size of the batches of pages sent to each extract "
+                        "process (default %(default)s)")
+    parser.add_argument("--reorder_window", type=int, default=1000, metavar="N",
+                        help="max number of batches being extracted or waiting to be output "
+                        "in order, at least twice the processes (default %(default)s)")
+    parser.add_argument("--queue_size", type=int, default=0, metavar="N",
+                        help="max number of batches waiting in the jobs and output queues "
+                        "(default: 10 per process)")
+    parser.add_argument("--autotune", action="store_true",
+                        help="adjust during the run the number of extract processes, up to "
+                        "--processes, and the bound of the jobs queue, and log the values settled on")
+    parser.add_argument("--giant_page", default="0", metavar="n[KMG]",
+                        help="extract pages of this size or more, each in a batch of its own, by "
+                        "processes of their own (default 0: none)")
+    parser.add_argument("--giant_processes", type=int, default=1, metavar="N",
+                        help="number of extract processes for giant pages (default %(default)s)")
+    parser.add_argument("--slow_pages", type=int, default=0, metavar="N",
+                        help="log at the end the N pages that took longest to extract")
+    parser.add_argument("--unordered", action="store_true",
+                        help="output articles as soon as they are extracted, not in dump order")
+    parser.add_argument("--shm_slots", type=int, default=0, metavar="N",
+                        help="pass the text of batches to the extract processes through N slots "
+                        "of shared memory, each twice the batch size (Python >= 3.8)")
 
     args = parser.parse_args()
 
@@ -78,8 +174,86 @@ def main():
 
     # Convert size to integers
     args.file_size = size2integer(args.bytes, minimum=MIN_FILE_SIZE)
+    args.batch_size = size2integer(args.batch_size)
+    args.cache_size = size2integer(args.cache_size)
+    args.read_size = size2integer(args.read_size)
+    args.giant_page = size2integer(args.giant_page)
+    if args.batch_size < 1:
+        parser.error("--batch_size must be at least 1 byte")
+    if args.read_size < 1:
+        parser.error("--read_size must be at least 1 byte")
+
+    # Output codec, or None
+    args.compress = args.compression or ('bz2' if args.compress else None)
+    if args.compression_level is not None and args.compress:
+        lowest = 0 if args.compress in ('gzip', 'xz') else 1
+        if not lowest <= args.compression_level <= 9:
+            parser.error("--compression_level for %s must be between %d and 9" % (
+                args.compress, lowest))
+
+    if args.multistream_index and args.input_file == '-':
+        parser.error("--multistream_index requires a dump file, not stdin")
+    if args.decompress_processes and os.path.splitext(args.input_file)[1] not in ('.bz2', '.gz'):
+        parser.error("--decompress_processes requires a .bz2 or .gz dump file")
+    if args.gzip_index and not (args.decompress_processes and args.input_file.endswith('.gz')):
+        parser.error("--gzip_index requires --decompress_processes and a .gz dump file")
+    if args.decode_process and (args.input_file == '-' or args.multistream_index or
+                                args.decompress_processes or args.split_input):
+        parser.error("--decode_process requires a dump file, read by the mapper "
+                     "(no --multistream_index, --decompress_processes or --split_input)")
+    if args.split_input and (args.input_file == '-' or
+                             os.path.splitext(args.input_file)[1] in ('.bz2', '.gz')):
+        parser.error("--split_input requires an uncompressed dump file")
+
+    if args.shm_slots and sys.version_info < (3, 8):
+        parser.error("--shm_slots requires Python 3.8 or later")
+    if args.shard_per_worker and args.output == '-':
+        parser.error("--shard_per_worker requires an output directory")
+
+    if args.previous:
+        args.page_manifest = True
+        if not os.path.isfile(os.path.join(args.previous, PAGE_MANIFEST)):
+            parser.error("--previous requires a directory with a %s" % PAGE_MANIFEST)
+    if args.page_manifest and (args.output == '-' or args.shard_per_worker or args.shm_slots or
+                               args.multistream_index or args.split_input):
+        parser.error("--page_manifest requires an output directory, written by the writer process, "
+                     "and pages read by the mapper (no --shm_slots, --multistream_index or "
+                     "--split_input)")
+
+    if args.giant_page and (args.multistream_index or args.split_input):
+        parser.error("--giant_page requires pages read by the mapper "
+                     "(no --multistream_index or --split_input)")
+    if args.giant_processes < 1:
+        parser.error("--giant_processes must be at least 1")
+    if args.page_budget < 0:
+        parser.error("--page_budget must be positive")
+    if args.page_budget and not hasattr(signal, 'setitimer'):
+        parser.error("--page_budget requires signal.setitimer (Unix)")
+    if args.quarantine and not args.page_budget:
+        parser.error("--quarantine requires --page_budget")
+    if args.queue_size < 0:
+        parser.error("--queue_size must be positive")
+    if args.autotune and args.shard_per_worker:
+        parser.error("--autotune cannot restart extract processes writing their own shards "
+                     "(--shard_per_worker)")
+
+    if args.metrics_port and not 0 < args.metrics_port < 65536:
+        parser.error("--metrics_port must be between 1 and 65535")
+    if args.metrics_interval <= 0:
+        parser.error("--metrics_interval must be positive")
 
-    if args.output != '-':
+    if args.doc_index and (args.output == '-' or args.shard_per_worker):
+        parser.error("--doc_index requires an output directory, written by the writer process")
+    if (args.checkpoint or args.resume) and (args.output == '-' or args.unordered or
+                                             args.shard_per_worker):
+        parser.error("--checkpoint and --resume require an output directory, written in dump "
+                     "order by the writer process (no --unordered or --shard_per_worker)")
+    if args.resume:
+        if not os.path.isfile(os.path.join(args.output, CHECKPOINT)):
+            parser.error("--resume requires a %s in %s" % (CHECKPOINT, args.output))
+        if args.split_input and read_checkpoint(args.output).get('input') is None:
+            parser.error("--resume with --split_input requires a checkpoint made with --split_input")
+    elif args.output != '-':
         assert not os.path.isdir(args.output), (
             f"Output folder {args.output} does already exist!"
         )
@@ -0,0 +1,173 @@
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Array, Value
+from timeit import default_timer
+
+# Prefix of the names of the metrics
+PREFIX = 'wikiextractor_'
+
+
+class Metrics(object):
+    """
+    Counters of an extraction, in shared memory, updated by the mapper, the
+    extract processes, the reduce process and the writer process, and
+    reported in the Prometheus text format by a MetricsReporter in the main
+    process.
+    """
+
+    def __init__(self, workers: int, input_size: int = 0) -> None:
+        """
+        :param workers: number of extract processes.
+        :param input_size: size of the input file in bytes, 0 if unknown.
+        """
+        self.input_size = input_size
+        self.input_bytes = Value('q', 0)
+        self.pages_dispatched = Value('q', 0)
+        self.pages_skipped = Value('q', 0)
+        self.batches_dispatched = Value('q', 0)
+        self.pages_done = Value('q', 0)  # updated by all extract processes
+        self.batches_done = Value('q', 0)
+        self.reorder_buffer = Value('q', 0)
+        self.output_bytes = Value('q', 0)
+        self.busy = Array('d', workers)  # seconds each extract process spent on batches
+
+    def dispatched(self, batches: int, pages: int = 0, skipped: int = 0) -> None:
+        """
+        Called by the mapper with its totals.
+        """
+        self.batches_dispatched.value = batches
+        self.pages_dispatched.value = pages
+        self.pages_skipped.value = skipped
+
+    def done(self, worker: int, pages: int, seconds: float) -> None:
+        """
+        Called by an extract process for each batch.
+        """
+        with self.pages_done.get_lock():
+            self.pages_done.value += pages
+            self.batches_done.value += 1
+        self.busy[worker] += seconds
+
+
+class MetricsReporter(object):
+    """
+    Report the metrics of an extraction, periodically writing them to a file
+    (for the textfile collector of the Prometheus node exporter) and/or
+    serving them over HTTP on localhost.
+    """
+
+    def __init__(self, metrics: Metrics, queues: dict, filename: str = None, port: int = 0,
+                 interval: float = 10, position=None) -> None:
+        """
+        :param queues: the queues whose depth to report, by name.
+        :param filename: file where to write the metrics, or None.
+        :param port: port of the HTTP server, or 0 for none.
+        :param interval: seconds between writes of the file.
+        :param position: function returning the byte offset reached in the
+            input file, when the mapper reads it itself.
+        """
+        self.metrics = metrics
+        self.queues = queues
+        self.filename = filename
+        self.interval = interval
+        self.position = position
+        self.start = default_timer()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.server = None
+        if port:
+            self.server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+            self.server.reporter = self
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            logging.info("Serving metrics on http://127.0.0.1:%d/metrics", port)
+        if filename:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self) -> None:
+        with open(self.filename + '.tmp', 'w') as f:
+            f.write(self.render())
+        os.replace(self.filename + '.tmp', self.filename)  # never read half written
+
+    def stop(self) -> None:
+        """
+        Write the final metrics and stop reporting.
+        """
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.write()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def render(self) -> str:
+        """
+        :return: the metrics in the Prometheus text exposition format.
+        """
+        metrics = self.metrics
+        if self.position:
+            try:
+                metrics.input_bytes.value = self.position()
+            except (OSError, ValueError):  # input closed, or not a file
+                pass
+        lines = []
+
+        def add(name, kind, help, value, labels=''):
+            if not lines or lines[-1].split('{')[0].split(' ')[0] != PREFIX + name:
+                lines.append('# HELP %s%s %s' % (PREFIX, name, help))
+                lines.append('# TYPE %s%s %s' % (PREFIX, name, kind))
+            lines.append('%s%s%s %s' % (PREFIX, name, labels, value))
+
+        add('elapsed_seconds', 'gauge', 'Seconds since the start of the extraction.',
+            '%.3f' % (default_timer() - self.start))
+        add('input_bytes', 'counter', 'Bytes of the input file consumed.', metrics.input_bytes.value)
+        if metrics.input_size:
+            add('input_size_bytes', 'gauge', 'Size of the input file.', metrics.input_size)
+            add('input_ratio', 'gauge', 'Fraction of the input file consumed.',
+                '%.4f' % (metrics.input_bytes.value / metrics.input_size))
+        add('batches_dispatched', 'counter', 'Batches dispatched by the mapper.',
+            metrics.batches_dispatched.value)
+        add('pages_dispatched', 'counter', 'Pages dispatched by the mapper.',
+            metrics.pages_dispatched.value)
+        add('pages_skipped', 'counter', 'Pages skipped by the mapper (other namespaces, redirects, '
+            'duplicates, already output).', metrics.pages_skipped.value)
+        add('batches_done', 'counter', 'Batches extracted.', metrics.batches_done.value)
+        add('pages_done', 'counter', 'Pages extracted.', metrics.pages_done.value)
+        for name, queue in self.queues.items():
+            try:
+                depth = queue.qsize()
+            except NotImplementedError:  # macOS
+                continue
+            add('queue_depth', 'gauge', 'Items in a queue.', depth, '{queue="%s"}' % name)
+        for worker, seconds in enumerate(metrics.busy[:]):
+            add('worker_busy_seconds', 'counter', 'Seconds an extract process spent on batches.',
+                '%.3f' % seconds, '{worker="%d"}' % worker)
+        add('reorder_buffer', 'gauge', 'Batches waiting to be output in order.',
+            metrics.reorder_buffer.value)
+        add('output_bytes', 'counter', 'Bytes of text written, before compression.',
+            metrics.output_bytes.value)
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.reporter.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # no log line per scrape
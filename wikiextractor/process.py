@@ -1,103 +1,374 @@
+import bz2
+import cProfile
 import fileinput
+import heapq
 import logging
-import re
+import os
+import signal
 import sys
-from io import StringIO
-from multiprocessing import Process, Queue
+from multiprocessing import BoundedSemaphore, Process, Queue
 from timeit import default_timer
 
 import tqdm
 
-from wikiextractor.clean import Extractor
+from wikiextractor.autotune import AdjustableQueue, Autotuner
+from wikiextractor.cache import TextCache, create_cache
+from wikiextractor.clean import (Extractor, SlowPages, StageStats, compact,
+                                 fallbackClean)
+from wikiextractor.decompress import (GZIP_MAX_MEMBER, DecodingReader,
+                                      ParallelDecompressor)
+from wikiextractor.metrics import Metrics, MetricsReporter
+from wikiextractor.reader import (collect_siteinfo, read_bytes,
+                                  read_multistream_index, read_range,
+                                  read_streams, split_dump)
 from wikiextractor.regex import tag_regex
+from wikiextractor.transport import SharedPageBuffer
 from wikiextractor.utils import hook_compressed_encoded
-from wikiextractor.writer import NextFile, OutputSplitter
+from wikiextractor.writer import (CHECKPOINT, DocIndex, NextFile,
+                                  OutputSplitter, PageManifest, PreviousOutput,
+                                  ShardWriter, read_checkpoint,
+                                  read_page_manifest, write_checkpoint)
 
 
 def process_dump(args):
     """
     Args must contain:
         :param input_file: name of the wikipedia dump file; '-' to read from stdin
+        :param multistream_index: optional index of a multistream bz2 dump, whose
+            streams are then decompressed in parallel by the extraction processes.
+        :param decompress_processes: number of processes decompressing blocks of
+            a bz2 or gzip dump in parallel, or 0 to decompress it serially.
+        :param gzip_index: seek index of the members of a gzip dump, or None
+            for the default, next to it.
+        :param split_input: whether byte ranges of the (uncompressed) dump are
+            scanned for pages by the extraction processes.
+        :param decode_process: whether the dump is decompressed and decoded by a
+            separate process, in chunks of read_size bytes.
         :param template_file: optional file with template definitions.
         :param output: directory where to store extracted data, or '-' for stdout
         :param file_size: max size of each extracted file, or None for no max (one file)
-        :param compress: whether to compress files with bzip.
+        :param compress: the codec compressing files, or None.
+        :param compression_level: the compression level, or None for the default.
+        :param compression_threads: number of threads of the writer compressing files.
         :param process_count: number of extraction processes to spawn.
+        :param batch_size: approximate size in bytes of the batches of pages
+            dispatched to the extraction processes.
+        :param reorder_window: max number of batches dispatched and not yet
+            output, bounding the memory used for reordering them.
+        :param unordered: whether to output batches as soon as they are done.
+        :param shard_per_worker: whether each extraction process writes its own
+            files, in a subdirectory of output, instead of the writer process.
+        :param shm_slots: number of slots of the shared memory buffer passing
+            the text of batches to the extraction processes, or 0 to queue it.
+        :param page_manifest: whether to record the revision and output location
+            of each article in output/pages.tsv.
+        :param previous: optional output directory of a previous run with a page
+            manifest, whose output is copied for articles with the same revision.
+        :param doc_index: whether to record the location of each article in
+            output/docs.tsv.
+        :param checkpoint: seconds between checkpoints of the output, or 0.
+        :param resume: whether to continue the run interrupted after the last
+            checkpoint in output.
+        :param cache: optional SQLite database where to keep the cleaned text of
+            articles, to reuse in later extractions.
+        :param cache_size: max size in bytes of the texts in the cache.
+        :param profile_stages: whether to time the stages of cleaning in the
+            extraction processes and log their merged table at the end.
+        :param profile_dir: optional directory where each extraction process
+            dumps its cProfile statistics.
+        :param metrics_file: optional file where to write the metrics of the
+            extraction periodically, in the Prometheus text format.
+        :param metrics_port: optional localhost port where to serve the metrics.
+        :param metrics_interval: seconds between writes of metrics_file.
+        :param queue_size: max number of batches in the jobs and output queues,
+            or 0 for 10 per process.
+        :param autotune: whether to adjust the number of extraction processes,
+            up to process_count, and the bound of the jobs queue during the run.
+        :param giant_page: size in bytes from which pages are extracted by the
+            giant pages lane, or 0 for none.
+        :param giant_processes: number of extraction processes of the lane.
+        :param slow_pages: number of the slowest pages to log at the end, or 0.
+        :param page_budget: seconds of CPU time allowed to extract a page, beyond
+            which it is cleaned by the fallback cleaner, or 0 for no limit.
+        :param quarantine: optional directory where to write the pages over
+            budget also with the fallback cleaner, and the report of the pages
+            over budget.
     """
 
-    # Define input stream
-    if args.input_file == '-':
+    # what was written before the last checkpoint is skipped
+    resume = read_checkpoint(args.output) if args.resume else None
+    if resume:
+        logging.info("Resuming after %d articles (%d batches)",
+                     resume['articles'], resume['batches'])
+
+    # Workers either get single pages, or spans of the input from which
+    # loader() produces pages.
+    spans = None
+    loader = None
+    if args.multistream_index:
+        # Each bz2 stream is decompressed and scanned by the worker processes
+        offsets = read_multistream_index(args.multistream_index)
+        header = bz2.decompress(read_bytes(args.input_file, 0, offsets[0]))
+        collect_siteinfo(args, header.decode('utf-8').splitlines(True))
+        spans = list(zip(offsets, offsets[1:] + [None]))
+        if resume:
+            spans = spans[resume['batches']:]
+        loader = read_streams
+        input = None
+    elif args.split_input:
+        # Byte ranges of the memory mapped dump are scanned by the worker processes
+        with open(args.input_file, encoding='utf-8') as header:
+            collect_siteinfo(args, header)
+        # the ranges depend on the number of processes: resume from the
+        # offset reached, not after a number of ranges
+        spans = split_dump(args.input_file, args.processes, resume and resume['input'])
+        loader = read_range
+        input = None
+    elif args.input_file == '-':
         input = sys.stdin
+    elif args.decompress_processes:
+        input = ParallelDecompressor(args.input_file, args.decompress_processes, args.gzip_index)
+        if input.jobs is None:
+            logging.warning("%s has a single gzip member, or members of more than %d MB: "
+                            "it is read serially", args.input_file, GZIP_MAX_MEMBER // (1024 * 1024))
+            input = fileinput.FileInput(args.input_file, openhook=hook_compressed_encoded)
+    elif args.decode_process:
+        input = DecodingReader(args.input_file, args.read_size)
     else:
         input = fileinput.FileInput(args.input_file, openhook=hook_compressed_encoded)
 
     # Collect siteinfo
-    for line in tqdm.tqdm(input, desc="Reading dump siteinfo"):
-        tags = tag_regex.search(line)
-
-        if tags:
-            tag = tags.group(2)
-
-            if tag == 'base':
-                # discover urlbase from the xml dump file
-                # /mediawiki/siteinfo/base
-                base = tags.group(3)
-                args.urlbase = base[:base.rfind("/")]
-
-            elif tag == 'namespace':
-                args.knownNamespaces.add(tags.group(3))
-                if re.search('key="10"', line):
-                    args.templateNamespace = tags.group(3)
-                    args.templatePrefix = args.templateNamespace + ':'
-                elif re.search('key="828"', line):
-                    args.moduleNamespace = tags.group(3)
-                    args.modulePrefix = args.moduleNamespace + ':'
-
-            elif tag == '/siteinfo':
-                break
+    if input is not None:
+        collect_siteinfo(args, tqdm.tqdm(input, desc="Reading dump siteinfo"))
 
     # process pages
     logging.info("Starting page extraction from %s.", args.input_file)
     extract_start = default_timer()
 
     # Parallel Map/Reduce:
-    # - pages to be processed are dispatched to workers
+    # - pages to be processed are dispatched to workers, in batches
     # - a reduce process collects the results, sort them and print them.
 
-    maxsize = 10 * args.processes
+    maxsize = args.queue_size or 10 * args.processes
 
     # output queue
     output_queue = Queue(maxsize=maxsize)
     results_queue = Queue()
 
+    # bound on the batches waiting to be reordered
+    if args.unordered or args.shard_per_worker:
+        window = None
+    else:
+        window = BoundedSemaphore(max(args.reorder_window, 2 * args.processes))
+
+    # giant pages go to processes of their own, so that they do not hold up batches of
+    # normal pages, and they are dispatched without waiting for them
+    lane_size = args.giant_processes if args.giant_page and spans is None else 0
+
+    # counters shared by all processes, for live metrics
+    metrics = None
+    if args.metrics_file or args.metrics_port or args.autotune:
+        input_size = os.path.getsize(args.input_file) if args.input_file != '-' else 0
+        metrics = Metrics(max(1, args.processes) + lane_size, input_size)
+
     # Reduce job that sorts and prints output
-    reduce = Process(target=reduce_process, args=(output_queue, results_queue))
-    reduce.start()
+    if not args.shard_per_worker:
+        reduce = Process(target=reduce_process, args=(output_queue, results_queue, window, metrics))
+        reduce.start()
 
     # initialize jobs queue
-    jobs_queue = Queue(maxsize=maxsize)
-
-    # start worker processes
-    logging.info("Using %d extract processes.", args.processes)
-    workers = []
-    for _ in range(max(1, args.processes)):
+    if args.autotune:
+        jobs_queue = AdjustableQueue(maxsize, max(maxsize, 10 * args.processes))
+    else:
+        jobs_queue = Queue(maxsize=maxsize)
+
+    # text of batches of pages goes through shared memory
+    buffer = None
+    if args.shm_slots and spans is None:
+        buffer = SharedPageBuffer(args.shm_slots, 2 * args.batch_size)
+        loader = buffer
+
+    # statistics of the workers, sent when they terminate
+    stats_queue = None
+    if args.cache:
+        create_cache(args.cache)
+    if args.cache or args.profile_stages or args.slow_pages or args.page_budget:
+        stats_queue = Queue()
+    if args.profile_dir:
+        os.makedirs(args.profile_dir, exist_ok=True)
+    if args.quarantine:
+        os.makedirs(args.quarantine, exist_ok=True)
+
+    def start_worker(i, queue=jobs_queue):
+        shard = i if args.shard_per_worker else None
         extractor = Process(target=extract_process,
-                            args=(args, jobs_queue, output_queue))
+                            args=(args, queue, output_queue, loader, shard, stats_queue,
+                                  metrics, i))
         extractor.daemon = True  # only live while parent process lives
         extractor.start()
-        workers.append(extractor)
+        return extractor
+
+    # start worker processes
+    logging.info("Using %d extract processes.", args.processes)
+    tuner = None
+    if args.autotune:
+        tuner = Autotuner(jobs_queue, metrics, start_worker, max(1, args.processes),
+                          max(1, args.processes))
+        workers = tuner.started  # grows with the processes started
+    else:
+        workers = [start_worker(i) for i in range(max(1, args.processes))]
+    giant_queue = None
+    lane = []
+    if lane_size:
+        giant_queue = Queue(maxsize=2 * lane_size)
+        lane = [start_worker(max(1, args.processes) + i, giant_queue) for i in range(lane_size)]
+
+    if not args.shard_per_worker:
+        writer = Process(target=writer_process,
+                         args=(results_queue, args.output, args.compress, args.file_size,
+                               args.page_manifest, args.checkpoint, resume, args.doc_index,
+                               args.compression_level, args.compression_threads, metrics, spans))
+        writer.start()
+
+    reporter = None
+    if args.metrics_file or args.metrics_port:
+        queues = {'jobs': jobs_queue, 'output': output_queue, 'results': results_queue}
+        position = None
+        if isinstance(input, fileinput.FileInput):
+            # offset of the (compressed) file, read ahead of the mapper by a buffer
+            position = lambda: os.lseek(input.fileno(), 0, os.SEEK_CUR)
+        reporter = MetricsReporter(metrics, queues, args.metrics_file, args.metrics_port,
+                                   args.metrics_interval, position)
 
-    writer = Process(target=writer_process,
-                     args=(results_queue, args.output, args.compress, args.file_size))
-    writer.start()
     # Mapper process
+    if spans is not None:
+        for batch_ordinal, span in enumerate(spans):
+            if window is not None:
+                window.acquire()
+            jobs_queue.put((batch_ordinal, span))  # goes to any available extract_process
+            if metrics:
+                metrics.input_bytes.value = span[1] or metrics.input_size
+                metrics.dispatched(batch_ordinal + 1)
+        ordinal = len(spans)
+    else:
+        skip = resume['articles'] if resume else 0
+        ordinal = map_pages(args, input, jobs_queue, window, buffer, skip, metrics, giant_queue)
+        input.close()
+        if metrics:
+            metrics.input_bytes.value = metrics.input_size  # all read
+
+    # signal termination
+    active = len(workers)
+    if tuner:
+        tuner.stop()
+        active = tuner.active  # the others were stopped already
+    for _ in range(active):
+        jobs_queue.put(None)
+    for _ in lane:
+        giant_queue.put(None)
+
+    if stats_queue is not None:
+        hits = misses = 0
+        stage_stats = StageStats()
+        slow_pages = SlowPages(args.slow_pages)
+        over_budget = []
+        for _ in workers + lane:
+            stats = stats_queue.get()
+            if 'cache' in stats:
+                worker_hits, worker_misses = stats['cache']
+                hits += worker_hits
+                misses += worker_misses
+            if 'stages' in stats:
+                stage_stats.add(stats['stages'])
+            if 'slow' in stats:
+                slow_pages.add(stats['slow'])
+            if 'budget' in stats:
+                over_budget.extend(stats['budget'])
+        if args.cache:
+            logging.info("Cache %s: %d hits, %d misses (%.1f%% hits)", args.cache, hits, misses,
+                         100.0 * hits / max(1, hits + misses))
+        if args.profile_stages:
+            logging.info("Stages of %d extract processes:\n%s", len(workers + lane),
+                         '\n'.join(stage_stats.table()))
+        if args.slow_pages:
+            logging.info("Slowest %d pages:\n%s", len(slow_pages.heap),
+                         '\n'.join(slow_pages.table()))
+        if args.page_budget:
+            report_over_budget(over_budget, args.page_budget, args.quarantine)
+
+    # wait for workers to terminate
+    for w in workers + lane:
+        w.join()
+
+    if buffer is not None:
+        buffer.close()
+
+    if not args.shard_per_worker:
+        # signal end of work to reduce process
+        output_queue.put(None)
+        # wait for it to finish
+        reduce.join()
+        results_queue.put(None)
+        if reporter:
+            writer.join()  # for the final metrics
+
+    extract_duration = default_timer() - extract_start
+    extract_rate = ordinal / extract_duration
+    unit = 'chunks' if spans is not None else 'articles'
+    logging.info("Finished %d-process extraction of %d %s in %.1fs (%.1f %s/s)",
+                 args.processes, ordinal, unit, extract_duration, extract_rate, unit)
+    if reporter:
+        reporter.stop()
+
+
+def map_pages(args, input, jobs_queue, window=None, buffer=None, skip=0, metrics=None,
+              giant_queue=None):
+    """
+    Mapper: collect the lines of each page and dispatch the pages to extract,
+    in batches of about args.batch_size bytes.
+    :param input: iterable of lines following the siteinfo header.
+    :param window: semaphore acquired for each batch dispatched, if any.
+    :param buffer: SharedPageBuffer where to put the text of the batches, if any.
+    :param skip: number of pages to extract to skip, already output.
+    :param metrics: Metrics where to count the pages dispatched, if any.
+    :param giant_queue: where to dispatch pages of args.giant_page bytes or
+        more, each in a batch of its own, if any.
+    :return: the number of pages dispatched.
+    With args.page_manifest, pages are (id, title, page, revision, location),
+    where revision is the revision id and sha1, and location the (file, offset,
+    length) of the output of the previous run to copy, if the revision is the same.
+    """
+
+    def dispatch(queue, batch, shared=True):
+        """
+        Put batch in queue, through the shared memory buffer if shared.
+        """
+        nonlocal batch_ordinal
+        if window is not None:
+            window.acquire()
+        if buffer:
+            batch = buffer.pack(batch) if shared else (None, batch)
+        queue.put((batch_ordinal, batch))  # goes to any available extract_process
+        batch_ordinal += 1
+        if metrics:
+            metrics.dispatched(batch_ordinal, ordinal, seen - ordinal)
+
+    previous = read_page_manifest(args.previous) if args.previous else {}
+    copied = 0  # pages copied from the previous run
 
     # we collect individual lines, since str.join() is significantly faster
     # than concatenation
     page = []
     id = None
+    revid = None
+    sha1 = ''
     last_id = None
     ordinal = 0  # page count
+    seen = 0  # pages read, dispatched or not
+    batch = []  # pages to dispatch together
+    batch_bytes = 0
+    batch_ordinal = 0  # sequence number of batches
+    giants = 0  # pages dispatched to giant_queue
     inText = False
     redirect = False
     title = None
@@ -120,6 +391,12 @@ def process_dump(args):
             elif tag == 'id' and not id:
                 id = tags.group(3)
 
+            elif tag == 'id' and not revid:
+                revid = tags.group(3)
+
+            elif tag == 'sha1':
+                sha1 = tags.group(3) or ''
+
             elif tag == 'title':
                 title = tags.group(3)
 
@@ -142,112 +419,390 @@ def process_dump(args):
                 page.append(line)
 
             elif tag == '/page':
+                seen += 1
                 colon = title.find(':')
                 if (
                     (colon < 0 or title[:colon] in args.acceptedNamespaces) and 
                     id != last_id and
                     not redirect
                 ):
-                    job = (id, title, page, ordinal)
-                    jobs_queue.put(job)  # goes to any available extract_process
+                    if skip:  # already output
+                        skip -= 1
+                    else:
+                        text = ''.join(page)
+                        if args.page_manifest:
+                            revision = '%s\t%s' % (revid, sha1)
+                            location = None
+                            entry = previous.get(id)
+                            if entry and entry.startswith(revision + '\t'):
+                                filename, offset, length = entry[len(revision) + 1:].split('\t')
+                                location = (filename, int(offset), int(length))
+                                text = None
+                                size = location[2]
+                                copied += 1
+                            else:
+                                size = len(text)
+                            entry = (id, title, text, revision, location)
+                        else:
+                            entry = (id, title, text)
+                            size = len(text)
+                        ordinal += 1
+                        if giant_queue is not None and text is not None and size >= args.giant_page:
+                            # alone to the giant pages lane, keeping its place in the output
+                            if batch:
+                                dispatch(jobs_queue, batch)
+                                batch = []
+                                batch_bytes = 0
+                            dispatch(giant_queue, [entry], shared=False)
+                            giants += 1
+                        else:
+                            batch.append(entry)
+                            batch_bytes += size
+                            if batch_bytes >= args.batch_size:
+                                dispatch(jobs_queue, batch)
+                                batch = []
+                                batch_bytes = 0
                     last_id = id
-                    ordinal += 1
                 id = None
+                revid = None
+                sha1 = ''
                 page = []
 
-    input.close()
+    if args.previous:
+        logging.info("Copied %d unchanged articles from %s", copied, args.previous)
 
-    # signal termination
-    for _ in workers:
-        jobs_queue.put(None)
+    if giant_queue is not None:
+        logging.info("Dispatched %d pages of %d bytes or more to the giant pages lane",
+                     giants, args.giant_page)
 
-    # wait for workers to terminate
-    for w in workers:
-        w.join()
+    if batch:
+        dispatch(jobs_queue, batch)
+    if metrics:
+        metrics.dispatched(batch_ordinal, ordinal, seen - ordinal)
 
-    # signal end of work to reduce process
-    output_queue.put(None)
-    # wait for it to finish
-    reduce.join()
-    results_queue.put(None)
-
-    extract_duration = default_timer() - extract_start
-    extract_rate = ordinal / extract_duration
-    logging.info("Finished %d-process extraction of %d articles in %.1fs (%.1f art/s)",
-                 args.processes, ordinal, extract_duration, extract_rate)
+    return ordinal
 
 
 # ----------------------------------------------------------------------
 # Multiprocess support
 
 
-def extract_process(args, jobs_queue, output_queue):
+class PageTimeout(Exception):
+    """
+    Raised when the extraction of a page exceeds its budget of CPU time.
+    """
+
+
+def raise_page_timeout(signum, frame):
+    raise PageTimeout()
+
+
+class BudgetedExtractor(Extractor):
     """
-    Pull tuples of raw page content, do CPU/regex-heavy fixup, push finished text
+    Extractor giving each page a budget of CPU time, measured by the profiling
+    timer of the process (SIGPROF), which interrupts even a regex stuck in
+    backtracking. A page over budget is cleaned again by fallbackClean(),
+    with the same budget; if it is over budget again, it is output empty and
+    its wikitext is written to the quarantine directory, if any.
+    """
+
+    def __init__(self, args, budget, quarantine=None):
+        """
+        :param budget: seconds of CPU time allowed for each page.
+        :param quarantine: directory where to write the wikitext of pages over
+            budget with the fallback cleaner too, as <id>.wiki.
+        """
+        super().__init__(args)
+        self.budget = budget
+        self.quarantine = quarantine
+        self.fallback = False  # whether to clean with fallbackClean()
+        self.over_budget = []  # (id, title, characters, outcome) of the pages over budget
+        signal.signal(signal.SIGPROF, raise_page_timeout)
+
+    def clean_text(self, text, mark_headers=False):
+        if self.fallback:
+            return compact(fallbackClean(self, text), mark_headers=mark_headers)
+        return super().clean_text(text, mark_headers)
+
+    def extract_budgeted(self, out):
+        """
+        Extract the page within the budget, or raise PageTimeout.
+        The timer fires again every tenth of the budget, in case the signal
+        is swallowed by the code it interrupts.
+        """
+        signal.setitimer(signal.ITIMER_PROF, self.budget, self.budget / 10)
+        try:
+            super().extract(out)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+
+    def extract(self, out):
+        start = out.tell()
+        try:
+            self.extract_budgeted(out)
+            return
+        except PageTimeout:
+            pass
+        page = self.page
+        cache = self.cache
+        self.cache = None  # the fallback text is not the one to reuse
+        self.fallback = True
+        out.seek(start)
+        out.truncate()
+        try:
+            self.extract_budgeted(out)
+            outcome = 'fallback'
+        except PageTimeout:
+            out.seek(start)
+            out.truncate()
+            self.page = ''
+            super().extract(out)
+            outcome = 'quarantined'
+            if self.quarantine:
+                with open(os.path.join(self.quarantine, '%s.wiki' % self.id), 'w',
+                          encoding='utf-8') as f:
+                    f.write(page)
+        finally:
+            self.fallback = False
+            self.cache = cache
+            self.page = page
+        logging.warning("Page %s (%s) over the budget of %gs CPU time: %s", self.id, self.title,
+                        self.budget, outcome)
+        self.over_budget.append((self.id, self.title, len(page), outcome))
+
+
+def report_over_budget(pages, budget, quarantine=None):
+    """
+    Log the pages over budget, and write their list to quarantine/report.tsv.
+    :param pages: list of (id, title, characters, outcome).
+    """
+    quarantined = sum(1 for page in pages if page[3] == 'quarantined')
+    logging.info("%d pages over the budget of %gs CPU time: %d cleaned by the fallback cleaner, "
+                 "%d quarantined", len(pages), budget, len(pages) - quarantined, quarantined)
+    if quarantine:
+        with open(os.path.join(quarantine, 'report.tsv'), 'w', encoding='utf-8') as f:
+            for id, title, chars, outcome in pages:
+                f.write('%s\t%s\t%d\t%s\n' % (id, title, chars, outcome))
+
+
+def extract_process(args, jobs_queue, output_queue, loader=None, shard=None, stats_queue=None,
+                    metrics=None, worker=0):
+    """
+    Pull batches of raw page content, do CPU/regex-heavy fixup, push finished text
     :param jobs_queue: where to get jobs.
     :param output_queue: where to queue extracted text for output.
+    :param loader: when given, jobs are (ordinal, span) and loader(args, span)
+        produces the pages of the batch.
+    :param shard: when given, the finished text is written to the files of
+        this process, in args.output/worker_<shard>, rather than queued.
+    :param stats_queue: where to put the statistics of the process at the end:
+        a dict with the (hits, misses) of the cache as 'cache', the
+        StageStats as 'stages', the SlowPages as 'slow' and the pages over
+        budget as 'budget', when enabled.
+    :param metrics: Metrics where to count the batches done, if any.
+    :param worker: the number of this process, among the extract processes.
     """
+    if args.profile_dir:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if shard is not None:
+        output = ShardWriter(os.path.join(args.output, 'worker_%02d' % shard),
+                             args.file_size, args.compress, args.compression_level)
+    if args.page_budget:
+        extractor = BudgetedExtractor(args, args.page_budget, args.quarantine)
+    else:
+        extractor = Extractor(args)  # reused for all pages
+    previous = PreviousOutput(args.previous) if args.previous else None
+    if args.cache:
+        extractor.cache = TextCache(args.cache, args.cache_size, args)
+    if args.profile_stages:
+        extractor.stage_stats = StageStats()
+    if args.slow_pages:
+        extractor.slow_pages = SlowPages(args.slow_pages)
     while True:
-        job = jobs_queue.get()  # job is (id, title, page, ordinal)
+        job = jobs_queue.get()  # job is (ordinal, [(id, title, page), ...])
         if job:
-            out = StringIO()  # memory buffer
-            Extractor(args, *job[:3]).extract(out)  # (id, title, page)
-            text = out.getvalue()
-            output_queue.put((job[3], text))  # (ordinal, extracted_text)
-            out.close()
+            start = default_timer()
+            ordinal, pages = job
+            if loader:
+                pages = loader(args, pages)
+            if args.page_manifest:
+                texts = extract_or_copy(extractor, previous, pages)
+            elif args.doc_index:
+                pages = list(pages)
+                texts = [(id, title, None, text)
+                         for (id, title, _), text in zip(pages, extractor.extract_pages(pages))]
+            else:
+                texts = extractor.extract_pages(pages)  # pages are (id, title, page)
+            if extractor.cache:
+                extractor.cache.commit()
+            if shard is not None:
+                output.write(ordinal, texts)
+            else:
+                output_queue.put((ordinal, texts))  # (ordinal, extracted_texts)
+            if metrics:
+                metrics.done(worker, len(texts), default_timer() - start)
         else:
             break
+    if shard is not None:
+        output.close()
+    stats = {}
+    if extractor.cache:
+        extractor.cache.close()
+        stats['cache'] = extractor.cache.stats()
+    if extractor.stage_stats is not None:
+        stats['stages'] = extractor.stage_stats
+    if extractor.slow_pages is not None:
+        stats['slow'] = extractor.slow_pages
+    if args.page_budget:
+        stats['budget'] = extractor.over_budget
+    if stats_queue is not None:
+        stats_queue.put(stats)
+    if args.profile_dir:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(args.profile_dir, 'extract_%d.prof' % os.getpid()))
+
+
+def extract_or_copy(extractor, previous, pages):
+    """
+    Extract pages (id, title, page, revision, location), or copy the output of
+    the previous run from location when given.
+    :return: the list of (id, title, revision, text).
+    """
+    texts = []
+    for id, title, page, revision, location in pages:
+        if location is None:
+            text = extractor.extract_pages([(id, title, page)])[0]
+        else:
+            text = previous.read(*location)
+        texts.append((id, title, revision, text))
+    return texts
 
 
-def writer_process(results_queue, out_file, file_compress, file_size):
+def writer_process(results_queue, out_file, file_compress, file_size, page_manifest=False,
+                   checkpoint=0, resume=None, doc_index=False, compression_level=None,
+                   compression_threads=1, metrics=None, spans=None):
     """
     Write data to either the standard output or the file manager.
+    :param page_manifest: whether to write in out_file/pages.tsv the revision
+        and location of articles.
+    :param checkpoint: seconds between checkpoints, recording in
+        out_file/checkpoint.json what was written and where to continue.
+    :param resume: the last checkpoint, when continuing an interrupted run.
+    :param doc_index: whether to write in out_file/docs.tsv the location of
+        articles.
+    :param compression_level: level of the file_compress codec.
+    :param compression_threads: number of threads compressing files.
+    :param metrics: Metrics where to count the bytes written, if any.
+    :param spans: the input ranges of the batches, if any, whose offset reached
+        is recorded in checkpoints.
+    With page_manifest or doc_index, texts are (id, title, revision, text).
     """
 
+    index = None
     if out_file == '-':
         output = sys.stdout
         if file_compress:
             logging.warn("writing to stdout, so no output compression (use an external tool)")
     else:
+        index = DocIndex(out_file, resume and resume['index']) if doc_index else None
         nextFile = NextFile(out_file)
-        output = OutputSplitter(nextFile, file_size, file_compress)
+        output = OutputSplitter(nextFile, file_size, file_compress, resume and resume['output'],
+                                index, compression_level, compression_threads)
+    manifest = None
+    if page_manifest:
+        manifest = PageManifest(out_file, resume and resume['manifest'])
+    records = page_manifest or doc_index
+
+    articles = resume['articles'] if resume else 0
+    batches = resume['batches'] if resume else 0
+    first_batch = batches  # of this run, the first of spans
+    last_checkpoint = default_timer()
 
     while True:
-        data = results_queue.get()
-        if data is None:
+        texts = results_queue.get()
+        if texts is None:
             if output != sys.stdout:
                 output.close()
+            if manifest:
+                manifest.close()
+            if index:
+                index.close()
+            if (checkpoint or resume) and os.path.exists(os.path.join(out_file, CHECKPOINT)):
+                # run complete
+                os.remove(os.path.join(out_file, CHECKPOINT))
             break
-        output.write(data)
-
-
-def reduce_process(output_queue, results_queue):
+        for text in texts:
+            if records:
+                id, title, revision, text = text
+                location = output.write(text, (id, title) if index else None)
+                if manifest:
+                    manifest.record('%s\t%s' % (id, revision), *location)
+            else:
+                output.write(text)
+        if metrics:
+            if output == sys.stdout:
+                metrics.output_bytes.value += sum(len(text.encode('utf-8')) for text in texts)
+            else:
+                metrics.output_bytes.value = output.written
+        articles += len(texts)
+        batches += 1
+        if checkpoint and default_timer() - last_checkpoint >= checkpoint:
+            state = {'articles': articles, 'batches': batches, 'output': output.checkpoint(),
+                     'manifest': manifest.checkpoint() if manifest else None,
+                     'index': index.checkpoint() if index else None,
+                     'input': spans[batches - first_batch - 1][1] if spans else None}
+            write_checkpoint(out_file, state)
+            last_checkpoint = default_timer()
+
+
+def reduce_process(output_queue, results_queue, window=None, metrics=None):
     """
     Pull finished article text, write series of files (or stdout)
     :param output_queue: text to be output.
     :param results: output queue.
+    :param window: semaphore bounding the batches dispatched and not yet output,
+        released as batches are output in order; None to output the batches in
+        the order they are finished.
+    :param metrics: Metrics where to report the size of the reorder buffer, if any.
     """
 
     interval_start = default_timer()
     period = 100000
-    # FIXME: use a heap
-    ordering_buffer = {}  # collected pages
-    next_ordinal = 0  # sequence number of pages
+    articles = 0
+    reported = 0  # articles at the last progress report
+    ordering_buffer = []  # heap of collected batches (ordinal, texts)
+    high_water = 0  # max size of ordering_buffer
+    next_ordinal = 0  # sequence number of batches
     while True:
-        if next_ordinal in ordering_buffer:
-            results_queue.put(ordering_buffer.pop(next_ordinal))
-            # print(ordering_buffer.pop(next_ordinal))
-            next_ordinal += 1
+        # mapper puts None to signal finish
+        pair = output_queue.get()
+        if not pair:
+            break
+        if window is None:
+            ready = [pair]
+        else:
+            heapq.heappush(ordering_buffer, pair)
+            high_water = max(high_water, len(ordering_buffer))
+            ready = []
+            while ordering_buffer and ordering_buffer[0][0] == next_ordinal:
+                ready.append(heapq.heappop(ordering_buffer))
+                next_ordinal += 1
+            if metrics:
+                metrics.reorder_buffer.value = len(ordering_buffer)
+
+        for ordinal, texts in ready:
+            results_queue.put(texts)
+            if window is not None:
+                window.release()
+            articles += len(texts)
             # progress report
-            if next_ordinal % period == 0:
-                interval_rate = period / (default_timer() - interval_start)
+            if articles - reported >= period:
+                interval_rate = (articles - reported) / (default_timer() - interval_start)
                 logging.info("Extracted %d articles (%.1f art/s)",
-                             next_ordinal, interval_rate)
+                             articles, interval_rate)
                 interval_start = default_timer()
-        else:
-            # mapper puts None to signal finish
-            pair = output_queue.get()
-            if not pair:
-                break
-            ordinal, text = pair
-            ordering_buffer[ordinal] = text
+                reported = articles
+
+    if window is not None:
+        logging.info("Reorder buffer high-water mark: %d batches", high_water)
@@ -0,0 +1,171 @@
+import bz2
+import mmap
+import re
+
+from wikiextractor.regex import tag_regex
+
+SPLIT_SIZE = 16 * 1024 * 1024  # bytes of uncompressed dump per job
+
+
+def collect_siteinfo(args, input):
+    """
+    Read the <siteinfo> header of a dump and store the url base and the
+    known, template and module namespaces into args.
+    :param input: iterable of lines, consumed up to </siteinfo>.
+    """
+    for line in input:
+        tags = tag_regex.search(line)
+
+        if tags:
+            tag = tags.group(2)
+
+            if tag == 'base':
+                # discover urlbase from the xml dump file
+                # /mediawiki/siteinfo/base
+                base = tags.group(3)
+                args.urlbase = base[:base.rfind("/")]
+
+            elif tag == 'namespace':
+                args.knownNamespaces.add(tags.group(3))
+                if re.search('key="10"', line):
+                    args.templateNamespace = tags.group(3)
+                    args.templatePrefix = args.templateNamespace + ':'
+                elif re.search('key="828"', line):
+                    args.moduleNamespace = tags.group(3)
+                    args.modulePrefix = args.moduleNamespace + ':'
+
+            elif tag == '/siteinfo':
+                break
+
+
+def accept_page(args, title, redirect):
+    """
+    Whether a page must be extracted: redirects and pages outside the
+    accepted namespaces are skipped.
+    """
+    colon = title.find(':')
+    return (colon < 0 or title[:colon] in args.acceptedNamespaces) and not redirect
+
+
+def iter_pages(data, start=0, end=None):
+    """
+    Bytes-level scanner of <page> elements, e.g. in a decompressed stream.
+    :param data: bytes-like object supporting find() and slicing (bytes, mmap).
+    :return: an iterator of (id, title, text, redirect), with title and text
+    still XML escaped, as the line based mapper passes them.
+    """
+    if end is None:
+        end = len(data)
+    find = data.find
+    pos = start
+    while True:
+        s = find(b'<page>', pos, end)
+        if s < 0:
+            return
+        e = find(b'</page>', s, end)
+        if e < 0:
+            return
+        pos = e + 7
+
+        t = find(b'<title>', s, e) + 7
+        title = data[t:find(b'</title>', t, e)].decode('utf-8')
+        i = find(b'<id>', s, e) + 4
+        id = data[i:find(b'</id>', i, e)].decode('utf-8')
+        redirect = find(b'<redirect', s, e) >= 0
+
+        t = find(b'<text', s, e)
+        if t < 0:
+            text = ''
+        else:
+            t = find(b'>', t, e)
+            if data[t - 1:t] == b'/':  # open-close
+                text = ''
+            else:
+                text = data[t + 1:find(b'</text>', t, e)].decode('utf-8')
+        yield id, title, text, redirect
+
+
+def filter_pages(args, pages):
+    """
+    Select the pages to extract among those produced by iter_pages(), as
+    (id, title, page).
+    """
+    last_id = None
+    for id, title, text, redirect in pages:
+        if accept_page(args, title, redirect) and id != last_id:
+            yield id, title, text
+            last_id = id
+
+
+# ----------------------------------------------------------------------
+# Multistream dumps
+
+
+def read_multistream_index(index_file):
+    """
+    Read the companion index of a multistream dump, with lines of the form
+    offset:page_id:title
+    :return: the sorted list of distinct stream offsets.
+    """
+    offsets = []
+    last = None
+    with bz2.open(index_file, 'rt', encoding='utf-8') as f:
+        for line in f:
+            offset = int(line[:line.find(':')])
+            if offset != last:
+                offsets.append(offset)
+                last = offset
+    return offsets
+
+
+def read_bytes(filename, start, end=None):
+    """
+    Read bytes [start, end) of a file, up to its end when :param end: is None.
+    """
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        return f.read(-1 if end is None else end - start)
+
+
+def read_streams(args, span):
+    """
+    Decompress the bz2 streams within :param span: (start, end) of a
+    multistream dump and produce the pages to extract as (id, title, page).
+    """
+    data = bz2.decompress(read_bytes(args.input_file, *span))
+    return filter_pages(args, iter_pages(data))
+
+
+# ----------------------------------------------------------------------
+# Uncompressed dumps
+
+
+def split_dump(filename, processes, start=None):
+    """
+    Cut an uncompressed dump into byte ranges aligned on <page> boundaries,
+    of at most SPLIT_SIZE bytes and at least 4 per process.
+    :param start: offset of the first range (default: the first <page>).
+    :return: list of (start, end) ranges.
+    """
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        end = len(data)
+        size = min(SPLIT_SIZE, end // (4 * max(1, processes)) + 1)
+        if start is None:
+            start = data.find(b'<page>')
+        spans = []
+        while 0 <= start < end:
+            next = data.find(b'<page>', start + size)
+            if next < 0:
+                next = end
+            spans.append((start, next))
+            start = next
+    return spans
+
+
+def read_range(args, span):
+    """
+    Scan the byte range :param span: (start, end) of a memory mapped
+    uncompressed dump and produce the pages to extract as (id, title, page).
+    """
+    with open(args.input_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        yield from filter_pages(args, iter_pages(data, *span))
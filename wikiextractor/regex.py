@@ -215,6 +215,9 @@ EXT_IMAGE_REGEX = re.compile(
     re.X | re.S | re.U)
 
 
+# Delimiters of transclusions (template, parser functions) and tables
+nested_block_delimiters = [('{{', '}}'), ('{|', '|}')]
+
 # Match selfClosing HTML tags
 selfClosing_tag_patterns = [
     re.compile(r'<\s*%s\b[^>]*/\s*>' % tag, re.DOTALL | re.IGNORECASE) for tag in selfClosingTags
@@ -226,6 +229,11 @@ placeholder_tag_patterns = [
      repl) for tag, repl in placeholder_tags.items()
 ]
 
+# Match the opening of HTML placeholder tags
+placeholder_open_patterns = {
+    repl: re.compile(r'<\s*%s' % tag, re.IGNORECASE) for tag, repl in placeholder_tags.items()
+}
+
 # Match preformatted lines
 preformatted = re.compile(r'^ .*?$')
 
@@ -240,6 +248,15 @@ italic_quote = re.compile(r"''\"([^\"]*?)\"''")
 italic = re.compile(r"''(.*?)''")
 quote_quote = re.compile(r'""([^"]*?)""')
 
+# The same, as (open, close, char not allowed within, quote to wrap the content in)
+quote_delimiters = [
+    ("'''''", "'''''", '\n', ''),  # bold_italic
+    ("'''", "'''", '\n', ''),  # bold
+    ("''\"", "\"''", '"', '"'),  # italic_quote
+    ("''", "''", '\n', '"'),  # italic
+    ('""', '""', '"', '"'),  # quote_quote
+]
+
 # Matches space
 spaces = re.compile(r' {2,}')
 
@@ -254,6 +271,18 @@ discardElements = [
     'ref', 'references', 'img', 'imagemap', 'source', 'small'
 ]
 
+# Match opening and closing discarded tags
+discard_tag_patterns = [
+    (tag,
+     re.compile(r'<\s*%s\b[^>/]*>' % tag, re.IGNORECASE),
+     re.compile(r'<\s*/\s*%s>' % tag, re.IGNORECASE)) for tag in discardElements
+]
+
+# Match the name of each opening discarded tag: matches do not extend past
+# the name, so that tags within the attributes of others are found too.
+discard_regex = re.compile(r'<\s*(%s)\b(?=[^>/]*>)' % '|'.join(discardElements),
+                           re.IGNORECASE)
+
 # Match ignored tags
 ignored_tag_patterns = []
 
@@ -263,4 +292,19 @@ def ignoreTag(tag):
     ignored_tag_patterns.append((left, right))
 
 for tag in ignoredTags:
-    ignoreTag(tag)
\ No newline at end of file
+    ignoreTag(tag)
+
+# Match in a single scan HTML comments (group 1), selfClosing tags and both
+# halves of ignored tags. Every tag alternative ends at the first '>', hence
+# a tag match can only overlap other tags by nesting.
+# The common '<' prefix lets the regex engine skip quickly to candidates.
+markup_regex = re.compile(
+    r'<(?:(!--.*?-->)|\s*(?:%s)\b[^>]*/\s*>|(?:%s)\b.*?>|/\s*(?:%s)>)' % (
+        '|'.join(selfClosingTags), '|'.join(ignoredTags), '|'.join(ignoredTags)),
+    re.IGNORECASE | re.DOTALL)
+
+# Patterns of the fallback cleaning, whose matches cannot extend past the next
+# delimiter, so that scanning a text takes linear time
+fallback_tag = re.compile(r'<[^<>]*>')
+fallback_internal_link = re.compile(r'\[\[([^\[\]|]*)(?:\|([^\[\]]*))?\]\]')
+fallback_external_link = re.compile(r'\[(?:\w+:)?//[^\s\[\]]*([^\[\]]*)\]')
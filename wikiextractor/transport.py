@@ -0,0 +1,82 @@
+import sys
+from multiprocessing import Queue
+
+
+class SharedPageBuffer(object):
+    """
+    Ring of fixed size slots in shared memory, through which the mapper passes
+    the text of batches of pages to the extract processes: only descriptors
+    (slot, [(id, title, offset, length), ...]) go through the jobs queue.
+    Extract processes use it as the loader of the jobs, and give back the slot
+    once its pages are decoded.
+    """
+
+    def __init__(self, slots: int, slot_size: int) -> None:
+        from multiprocessing import shared_memory  # Python >= 3.8
+
+        self.slot_size = slot_size
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_size)
+        self.free = Queue()  # indexes of free slots
+        for slot in range(slots):
+            self.free.put(slot)
+
+    def __getstate__(self) -> dict:
+        # sent to processes by name
+        return {'name': self.shm.name, 'slot_size': self.slot_size, 'free': self.free}
+
+    def __setstate__(self, state: dict) -> None:
+        from multiprocessing import resource_tracker, shared_memory
+
+        self.slot_size = state['slot_size']
+        self.free = state['free']
+        # the creating process is in charge of unlinking it
+        if sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name=state['name'], track=False)
+            return
+        # Attaching registers the segment with the resource tracker of this
+        # process. Processes started by the creator (fork or spawn) share its
+        # tracker, where the name is registered already: unregistering it
+        # there would drop the creator's registration (and fail in the other
+        # processes). Only a tracker of our own must forget it.
+        shared = getattr(resource_tracker._resource_tracker, '_fd', None) is not None
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        if not shared:
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+    def pack(self, batch: list) -> tuple:
+        """
+        Copy the text of the pages of :param batch: into a free slot, waiting
+        for one if all are in use.
+        :return: the descriptor of the batch. Batches larger than a slot are
+        passed as they are, with slot None.
+        """
+        pages = [(id, title, text.encode('utf-8')) for id, title, text in batch]
+        if sum(len(data) for _, _, data in pages) > self.slot_size:
+            return None, batch
+        slot = self.free.get()
+        buf = self.shm.buf
+        offset = slot * self.slot_size
+        descriptors = []
+        for id, title, data in pages:
+            end = offset + len(data)
+            buf[offset:end] = data
+            descriptors.append((id, title, offset, len(data)))
+            offset = end
+        return slot, descriptors
+
+    def __call__(self, args, payload: tuple) -> list:
+        """
+        Loader of the pages of a batch, as (id, title, text).
+        """
+        slot, descriptors = payload
+        if slot is None:
+            return descriptors
+        buf = self.shm.buf
+        pages = [(id, title, str(buf[offset:offset + length], 'utf-8'))
+                 for id, title, offset, length in descriptors]
+        self.free.put(slot)
+        return pages
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
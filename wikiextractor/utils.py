@@ -3,7 +3,9 @@ import os
 
 def size2integer(bytes, minimum=None):
     power = 'kmg'.find(bytes[-1].lower()) + 1
-    file_size = int(bytes[:-1]) * 1024 ** power
+    if power:
+        bytes = bytes[:-1]
+    file_size = int(bytes) * 1024 ** power
     if minimum is not None and file_size < minimum:
         raise ValueError('Provided file_size is too small')
     return file_size
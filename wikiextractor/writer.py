@@ -1,6 +1,13 @@
 import bz2
+import gzip
+import json
+import lzma
 import os
-from io import TextIOWrapper
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BufferedIOBase
+
+from wikiextractor.reader import read_bytes
 
 
 class NextFile(object):
@@ -39,30 +46,400 @@ class NextFile(object):
         return f'{self.int2base26()}/wiki_{file_number}'
 
 
+# Uncompressed bytes compressed together, bounding the data to decompress
+# for reading a document
+CHUNK_SIZE = 256 * 1024
+
+# Output codecs: file extension, compress(data, level), decompress(data).
+# Files are sequences of chunks compressed separately, which each
+# decompress() reads as a whole.
+CODECS = {
+    'bz2': ('.bz2', lambda data, level: bz2.compress(data, level or 9), bz2.decompress),
+    'gzip': ('.gz', lambda data, level: gzip.compress(data, 9 if level is None else level),
+             gzip.decompress),
+    'xz': ('.xz', lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+}
+
+
+def decompress_output(filename: str, data: bytes) -> bytes:
+    """
+    Decompress data read from an output file, according to its extension.
+    """
+    for extension, _, decompress in CODECS.values():
+        if filename.endswith(extension):
+            return decompress(data)
+    return data
+
+
+def read_output(filename: str) -> bytes:
+    """
+    :return: the (decompressed) content of an output file.
+    """
+    with open(filename, 'rb') as f:
+        return decompress_output(filename, f.read())
+
+
 class OutputSplitter(object):
     """
     File-like object, that splits output to multiple files of a given max size.
+    Compressed files are sequences of chunks compressed separately, each of
+    about CHUNK_SIZE bytes, so that reading a document only requires
+    decompressing the chunk containing it.
+    Chunks can be compressed by a pool of threads, while the next ones are
+    filled, since the codecs release the GIL.
     """
-    def __init__(self, nextFile: NextFile, max_file_size: int = 0, compress: bool = True) -> None:
+    def __init__(self, nextFile: NextFile, max_file_size: int = 0, compress='bz2',
+                 resume: dict = None, index=None, level: int = None, threads: int = 1) -> None:
+        """
+        :param compress: the codec of the files, in CODECS, or None
+            (True for bz2).
+        :param resume: state returned by checkpoint(), to continue writing from.
+        :param index: DocIndex where to record the location of documents.
+        :param level: the compression level, None for the codec default.
+        :param threads: number of threads compressing chunks, 1 for none.
+        """
         self.nextFile = nextFile
-        self.compress = compress
+        self.compress = 'bz2' if compress is True else compress
         self.max_file_size = max_file_size
-        self.file = self.open(next(self.nextFile))
+        self.index = index
+        self.level = level
+        self.chunk = []  # data to compress together
+        self.chunk_size = 0
+        self.chunk_docs = []  # (doc, offset in chunk, length, characters)
+        self.written = 0  # uncompressed bytes written to all files
+        # chunks being compressed, written in order as (file, filename, result, chunk_docs),
+        # followed by (file, None, None, None) once the file is complete
+        self.pending = deque()
+        self.pool = ThreadPoolExecutor(threads) if self.compress and threads > 1 else None
+        self.max_pending = 2 * threads
+        if resume is None:
+            self.file = self.open(next(self.nextFile))
+        else:
+            self.nextFile.dir_index = resume['dir_index']
+            self.nextFile.file_index = resume['file_index']
+            self.file = self.reopen(self.nextFile.filepath(), resume['offset'], resume['size'])
 
     def reserve(self, size: int) -> None:
-        if self.file.tell() + size > self.max_file_size:
-            self.close()
+        if self.offset + size > self.max_file_size:
+            self.end_file()
             self.file = self.open(next(self.nextFile))
 
-    def write(self, data: str) -> None:
-        self.reserve(len(data))
-        self.file.write(data)
+    def write(self, data: str, doc: tuple = None) -> tuple:
+        """
+        :param doc: (id, title) of the document in data, to record in the index.
+        :return: the file name, the (uncompressed) byte offset and the length
+        in bytes of data as written.
+        """
+        encoded = data.encode('utf-8')
+        length = len(encoded)
+        self.reserve(length)
+        offset = self.offset
+        if self.compress:
+            if doc:
+                self.chunk_docs.append((doc, self.chunk_size, length, len(data)))
+            self.chunk.append(encoded)
+            self.chunk_size += length
+            if self.chunk_size >= CHUNK_SIZE:
+                self.flush_chunk()
+        else:
+            if doc:
+                self.index.record(doc, self.filename, offset, length, 0, length, len(data))
+            self.file.write(encoded)
+        self.offset += length
+        self.written += length
+        return self.filename, offset, length
+
+    def flush_chunk(self) -> None:
+        """
+        Compress the pending chunk, and write the chunks compressed so far.
+        """
+        if not self.chunk:
+            return
+        compress = CODECS[self.compress][1]
+        data = b''.join(self.chunk)
+        if self.pool:
+            result = self.pool.submit(compress, data, self.level)
+        else:
+            result = compress(data, self.level)
+        self.pending.append((self.file, self.filename, result, self.chunk_docs))
+        self.chunk = []
+        self.chunk_size = 0
+        self.chunk_docs = []
+        self.drain(self.max_pending)
+
+    def drain(self, keep: int = 0) -> None:
+        """
+        Write the compressed chunks, waiting for them while more than
+        :param keep: are pending.
+        """
+        pending = self.pending
+        while pending:
+            file, filename, result, chunk_docs = pending[0]
+            ready = filename is None or isinstance(result, bytes) or result.done()
+            if not ready and len(pending) <= keep:
+                break
+            pending.popleft()
+            if filename is None:  # end of file
+                file.close()
+                continue
+            data = result if isinstance(result, bytes) else result.result()
+            start = file.tell()
+            file.write(data)
+            for doc, offset, length, chars in chunk_docs:
+                self.index.record(doc, filename, start, len(data), offset, length, chars)
+
+    def end_file(self) -> None:
+        """
+        Close the current file, once its pending chunks are written.
+        """
+        self.flush_chunk()
+        self.pending.append((self.file, None, None, None))
+        self.drain(self.max_pending)
+
+    def checkpoint(self) -> dict:
+        """
+        Make what was written so far durable.
+        :return: the state where to resume writing: the indexes of the current
+        file in nextFile, its uncompressed size and its size.
+        """
+        self.flush_chunk()
+        self.drain()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {'dir_index': self.nextFile.dir_index, 'file_index': self.nextFile.file_index,
+                'offset': self.offset, 'size': self.file.tell()}
 
     def close(self) -> None:
-        self.file.close()
+        self.end_file()
+        self.drain()
+        if self.pool:
+            self.pool.shutdown()
 
-    def open(self, filename: str) -> TextIOWrapper:
-        if self.compress:
-            return bz2.BZ2File(filename + '.bz2', 'w')
+    def reopen(self, filename: str, offset: int, size: int) -> BufferedIOBase:
+        """
+        Open a file to append to, dropping what follows size.
+        :param offset: the uncompressed size of the file at size.
+        """
+        self.filename = filename + CODECS[self.compress][0] if self.compress else filename
+        self.offset = offset
+        file = open(self.filename, 'r+b')
+        file.truncate(size)
+        file.seek(size)
+        return file
+
+    def open(self, filename: str) -> BufferedIOBase:
+        self.filename = filename + CODECS[self.compress][0] if self.compress else filename
+        self.offset = 0  # uncompressed size of the file
+        return open(self.filename, 'wb')
+
+
+class ShardWriter(object):
+    """
+    Output of an extract process writing its own shards, with a manifest
+    recording where each batch of articles was written, as lines:
+    ordinal, file name, byte offset, length, number of articles.
+    """
+    def __init__(self, path_name: str, max_file_size: int = 0, compress='bz2',
+                 level: int = None) -> None:
+        self.root = os.path.dirname(path_name)
+        self.output = OutputSplitter(NextFile(path_name), max_file_size, compress, level=level)
+        self.manifest = open(os.path.join(path_name, 'manifest.tsv'), 'w')
+
+    def write(self, ordinal: int, texts: list) -> None:
+        segment = None  # [filename, offset, length, articles] written in one file
+        for text in texts:
+            filename, offset, length = self.output.write(text)
+            if segment and segment[0] == filename:
+                segment[2] += length
+                segment[3] += 1
+            else:
+                if segment:
+                    self.record(ordinal, *segment)
+                segment = [filename, offset, length, 1]
+        if segment:
+            self.record(ordinal, *segment)
+
+    def record(self, ordinal: int, filename: str, offset: int, length: int, articles: int) -> None:
+        self.manifest.write('%d\t%s\t%d\t%d\t%d\n' % (
+            ordinal, os.path.relpath(filename, self.root), offset, length, articles))
+
+    def close(self) -> None:
+        self.output.close()
+        self.manifest.close()
+
+
+def read_manifests(path_name: str):
+    """
+    Read back in dump order the output of extract processes writing their own
+    shards, using the manifests recording where each batch of articles was written.
+    :return: an iterator over the text of the batches.
+    """
+    entries = []
+    for name in sorted(os.listdir(path_name)):
+        manifest = os.path.join(path_name, name, 'manifest.tsv')
+        if os.path.isfile(manifest):
+            with open(manifest) as f:
+                for line in f:
+                    ordinal, filename, offset, length, _ = line.rstrip('\n').split('\t')
+                    entries.append((int(ordinal), name, filename, int(offset), int(length)))
+    # a batch split over two files has two entries, in the order they were written
+    entries.sort(key=lambda entry: entry[0])
+    current = {}  # worker -> (filename, data): the shards of a worker are read in sequence
+    for _, name, filename, offset, length in entries:
+        if current.get(name, (None,))[0] != filename:
+            current[name] = (filename, read_output(os.path.join(path_name, filename)))
+        data = current[name][1]
+        yield data[offset:offset + length].decode('utf-8')
+
+
+# ----------------------------------------------------------------------
+# Incremental extraction
+
+PAGE_MANIFEST = 'pages.tsv'
+
+
+class RecordFile(object):
+    """
+    Text file of records about the output, written along with it.
+    """
+    def __init__(self, path_name: str, name: str, offset: int = None) -> None:
+        """
+        :param offset: when resuming, the size of the file at the checkpoint.
+        """
+        self.root = path_name
+        filename = os.path.join(path_name, name)
+        if offset is None:
+            self.file = open(filename, 'w', encoding='utf-8')
         else:
-            return open(filename, 'w')
+            self.file = open(filename, 'r+', encoding='utf-8')
+            self.file.truncate(offset)
+            self.file.seek(offset)
+
+    def checkpoint(self) -> int:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class PageManifest(RecordFile):
+    """
+    Record of where the writer output each article, as lines:
+    page id, revision id, sha1, file name, byte offset, length.
+    """
+    def __init__(self, path_name: str, offset: int = None) -> None:
+        super().__init__(path_name, PAGE_MANIFEST, offset)
+
+    def record(self, page: str, filename: str, offset: int, length: int) -> None:
+        """
+        :param page: page id, revision id and sha1, tab separated.
+        """
+        self.file.write('%s\t%s\t%d\t%d\n' % (page, os.path.relpath(filename, self.root),
+                                              offset, length))
+
+
+def read_page_manifest(path_name: str) -> dict:
+    """
+    Read the page manifest of a previous run.
+    :return: a dict from page id to the rest of its line: revision id, sha1,
+    file name, offset and length, tab separated.
+    """
+    pages = {}
+    with open(os.path.join(path_name, PAGE_MANIFEST)) as f:
+        for line in f:
+            tab = line.find('\t')
+            pages[line[:tab]] = line[tab + 1:-1]
+    return pages
+
+
+class PreviousOutput(object):
+    """
+    Reader of the articles output by a previous run, using the locations in
+    its page manifest. Articles are read in dump order, so only the last file
+    read is kept.
+    """
+    def __init__(self, path_name: str) -> None:
+        self.path_name = path_name
+        self.filename = None
+        self.data = None
+
+    def read(self, filename: str, offset: int, length: int) -> str:
+        if filename != self.filename:
+            self.data = read_output(os.path.join(self.path_name, filename))
+            self.filename = filename
+        return self.data[offset:offset + length].decode('utf-8')
+
+
+# ----------------------------------------------------------------------
+# Checkpoints
+
+CHECKPOINT = 'checkpoint.json'
+
+
+def write_checkpoint(path_name: str, state: dict) -> None:
+    """
+    Replace the checkpoint of the output in :param path_name: atomically.
+    """
+    filename = os.path.join(path_name, CHECKPOINT)
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(filename + '.tmp', filename)
+
+
+def read_checkpoint(path_name: str) -> dict:
+    with open(os.path.join(path_name, CHECKPOINT)) as f:
+        return json.load(f)
+
+
+# ----------------------------------------------------------------------
+# Document index
+
+DOC_INDEX = 'docs.tsv'
+
+
+class DocIndex(RecordFile):
+    """
+    Index of the documents in the output, as lines: page id, title, file name,
+    byte offset and length of the chunk of the file containing the document
+    (the document itself in uncompressed files), byte offset and length of
+    the document in the decompressed chunk, number of characters.
+    """
+    def __init__(self, path_name: str, offset: int = None) -> None:
+        super().__init__(path_name, DOC_INDEX, offset)
+
+    def record(self, doc: tuple, filename: str, chunk_offset: int, chunk_length: int,
+               offset: int, length: int, chars: int) -> None:
+        """
+        :param doc: (id, title) of the document.
+        """
+        self.file.write('%s\t%s\t%s\t%d\t%d\t%d\t%d\t%d\n' % (
+            doc[0], doc[1], os.path.relpath(filename, self.root),
+            chunk_offset, chunk_length, offset, length, chars))
+
+
+def read_doc_index(path_name: str):
+    """
+    :return: an iterator over the entries of the document index of the output
+    in :param path_name:, as (id, title, file name, chunk offset, chunk length,
+    offset, length, characters).
+    """
+    with open(os.path.join(path_name, DOC_INDEX), encoding='utf-8') as f:
+        for line in f:
+            id, title, filename, *numbers = line.rstrip('\n').split('\t')
+            yield (id, title, filename, *map(int, numbers))
+
+
+def read_doc(path_name: str, entry: tuple) -> str:
+    """
+    Read a document of the output in :param path_name:, decompressing only
+    its chunk.
+    :param entry: the entry of the document in the index.
+    """
+    _, _, filename, chunk_offset, chunk_length, offset, length, _ = entry
+    data = read_bytes(os.path.join(path_name, filename), chunk_offset, chunk_offset + chunk_length)
+    data = decompress_output(filename, data)
+    return data[offset:offset + length].decode('utf-8')